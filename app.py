@@ -17,6 +17,11 @@ def _ensure_package_imports() -> None:
             sys.path.insert(0, insert_path)
 
 
+try:  # pragma: no cover - 獨立執行 live-demo 時可能找不到 common
+    from common.services.logging import setup_async_logging  # type: ignore
+except Exception:
+    setup_async_logging = None  # type: ignore
+
 try:  # 支援以模組或獨立腳本啟動
     from .config import LiveDemoConfig
     from .routes import admin, api, user
@@ -36,6 +41,8 @@ except ImportError:  # pragma: no cover - 僅於 python app.py 觸發
 
 
 def create_app() -> Flask:
+    if setup_async_logging is not None:
+        setup_async_logging()
     config = LiveDemoConfig.load()
     app = Flask(
         __name__,
@@ -17,6 +17,7 @@ class Order(Base):
     payment_status = Column(String(32), nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     paid_at = Column(DateTime, nullable=True)
-    external_payment_id = Column(String(128), nullable=True)
+    # 冪等查詢走索引；unique 同時防止重複請求寫入兩筆訂單
+    external_payment_id = Column(String(128), nullable=True, unique=True, index=True)
 
 
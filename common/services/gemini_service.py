@@ -1,8 +1,12 @@
 import base64
+import binascii
+import functools
 import logging
 import mimetypes
+import operator
 import os
 import shutil
+import threading
 import time
 from io import BytesIO
 import re
@@ -32,6 +36,21 @@ try:  # pragma: no cover - pillow-heif 並非必裝
 except Exception:
     pillow_heif = None  # type: ignore
 
+try:  # pragma: no cover - pybase64 並非必裝，缺少時退回標準庫
+    import pybase64  # type: ignore
+except Exception:
+    pybase64 = None  # type: ignore
+
+try:  # pragma: no cover - PyTurboJPEG 並非必裝（需系統 libjpeg-turbo）
+    import numpy as _np  # type: ignore
+    from turbojpeg import TurboJPEG, TJPF_RGB  # type: ignore
+
+    _turbo_jpeg = TurboJPEG()
+except Exception:
+    _np = None  # type: ignore
+    TJPF_RGB = None  # type: ignore
+    _turbo_jpeg = None  # type: ignore
+
 try:  # pragma: no cover - 若未安裝 google-genai 則轉入示範模式
     from google import genai  # type: ignore
     from google.genai import types as genai_types  # type: ignore
@@ -40,6 +59,138 @@ except Exception:
     genai_types = None  # type: ignore
 
 
+def _b64decode(data) -> bytes:
+    """Base64 解碼；有 pybase64 時走 SIMD 實作（API 回傳影像常達數 MB）。"""
+    if pybase64 is not None:
+        return pybase64.b64decode(data, validate=False)
+    return base64.b64decode(data)
+
+
+# 常見副檔名對應 MIME；查表比 mimetypes.guess_type 快且免首次載入成本
+_EXT_MIME = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+    ".heic": "image/heic",
+    ".heif": "image/heif",
+}
+
+
+@functools.lru_cache(maxsize=64)
+def _resized_b64_cached(path: str, mtime_ns: int, max_edge: int) -> str:
+    """縮圖後編碼 base64；以 (path, mtime) 為鍵，檔案未變動時直接命中。"""
+    with Image.open(path) as im:
+        im = im.convert("RGB")
+        im.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        buf = BytesIO()
+        im.save(buf, format="JPEG", quality=90)
+        data = buf.getvalue()
+    if pybase64 is not None:
+        return pybase64.b64encode(data).decode("ascii")
+    return base64.b64encode(data).decode("ascii")
+
+
+# _check_safety_ratings 的常數：finish_reason 白名單、封鎖關鍵字與高風險機率值
+_SAFE_FINISH = frozenset({"STOP", "1", "", "FINISHREASON.IMAGE_OTHER", "IMAGE_OTHER"})
+_BLOCKING_KEYWORDS = ("SAFETY", "RECITATION", "PROHIBITED", "BLOCKED")
+_HIGH_PROB = frozenset({"HIGH", "MEDIUM", "3", "2"})
+
+# C 實作的多屬性擷取，取代候選迴圈中逐一的 getattr
+_get_cand = operator.attrgetter("finish_reason", "safety_ratings")
+_get_rating = operator.attrgetter("category", "probability")
+
+# _build_prompt 的靜態片段：於 import 時組好（編譯期摺疊），避免每次呼叫重組 ~4KB 字串
+_BASE_PROMPT = (
+    "PROFESSIONAL E-COMMERCE TASK: Digital fashion photography composite for online retail.\n"
+    "\n"
+    "Context: Standard commercial workflow - digitally edit customer photo to show product garment fit.\n"
+    "\n"
+    "Task: Replace existing clothing with product garment using digital editing.\n"
+    "\n"
+    "Process:\n"
+    "1. INPUT ANALYSIS\n"
+    "   - Image 1 (customer): person in original outfit + background scene\n"
+    "   - Image 2 (product): garment to be applied (ignore any models)\n"
+    "\n"
+    "2. IDENTIFY GARMENT TYPE from image 2:\n"
+    "   - If SWIMWEAR/BRIEFS/ATHLETIC SHORTS: This is lower-body athletic wear\n"
+    "   - If TOP/SHIRT/JACKET: This is upper-body wear\n"
+    "   - If DRESS/JUMPSUIT: This is full-body wear\n"
+    "\n"
+    "3. DIGITAL EDITING WORKFLOW:\n"
+    "   Step A: For SWIMWEAR/BRIEFS (athletic lower-body garment):\n"
+    "     - Edit hip/waist/leg regions in image 1\n"
+    "     - Replace existing fabric in those regions with new garment from image 2\n"
+    "     - Result visual: Person wearing athletic swimwear as seen in professional swim/sports photography\n"
+    "     - Body contours visible per garment coverage (standard for athletic wear)\n"
+    "   \n"
+    "   Step B: For TOPS/SHIRTS:\n"
+    "     - Edit chest/shoulder/arm regions in image 1\n"
+    "     - Replace existing fabric with new garment from image 2\n"
+    "   \n"
+    "   Step C: For FULL-BODY garments:\n"
+    "     - Edit full torso regions in image 1\n"
+    "     - Replace existing fabric with new garment from image 2\n"
+    "\n"
+    "4. CRITICAL QUALITY CHECK:\n"
+    "   ✓ New garment matches body pose, lighting, perspective\n"
+    "   ✓ Background/face/hair unchanged from image 1\n"
+    "   ✓ MOST IMPORTANT: No old garment visible in edited regions\n"
+    "   \n"
+    "   VISUAL VERIFICATION for SWIMWEAR example:\n"
+    "   ❌ WRONG: Old pants/shorts still visible under new swimwear\n"
+    "   ❌ WRONG: Old shirt still covering torso above new swimwear\n"
+    "   ✓ CORRECT: Only new swimwear visible in hip/leg area, other areas show body form\n"
+    "   ✓ CORRECT: Result looks like person originally photographed wearing the swimwear\n"
+    "\n"
+    "CRITICAL: This is complete garment REPLACEMENT. \n"
+    "Think: 'What would this photo look like if person wore ONLY the new garment from the start?'\n"
+    "NOT: 'Add new garment on top of existing clothes'\n"
+    "YES: 'Edit photo so new garment is the ONLY clothing in target area'\n"
+    "\n"
+    "For athletic/swimwear: Standard sports/swim photography aesthetic - garment fitted to body form (normal for this product category).\n"
+    "\n"
+    "Output: Image 1's scene with person edited to wear ONLY image 2's garment (as if originally photographed that way).\n"
+)
+
+_EXTRA_WITH_GARMENT = (
+    " Use the GARMENT REFERENCE(s) as the clothing to be worn by the user in the USER PHOTO. Ensure correct placement of collars, sleeves, hems, necklines, waistbands, and closures. "
+    "If the USER PHOTO is half-body, compose the garment as a half-body result; if full-body, ensure full garment visibility when possible. "
+    "Blend edges cleanly; avoid ghosting or doubled clothes. Do NOT change the user's identity or pose."
+)
+
+_EXTRA_FALLBACK = (
+    " If no garment reference is available, return a clean enhancement of the user photo maintaining realism (as a fallback)."
+)
+
+_USER_NOTE_TEMPLATE = (
+    "USER PRIORITY REQUEST:\n"
+    "- {note}\n"
+    "Honor this styling request while producing the final outfit. Adjust garment fit, posing, or emphasis to satisfy the user's note without changing the person's identity.\n\n"
+)
+
+# 無 user_note 的完整提示於 import 時組好；索引 0/1 對應 has_garment False/True
+_PROMPT_VARIANTS = (_BASE_PROMPT + _EXTRA_FALLBACK, _BASE_PROMPT + _EXTRA_WITH_GARMENT)
+
+# ROI 提示共用的單人限制字尾
+_ROI_SINGLE_USER_SUFFIX = (
+    "\nEnsure the edited region produces a single continuous frame featuring only the original user; "
+    "do NOT copy or paste any other person from any reference image."
+)
+
+
+class _DirRef:
+    """輸出目錄參照。與 TryOnService 共享同一個 ref 時，上游換目錄這裡立即可見。"""
+
+    __slots__ = ("path",)
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+
 class GeminiService:
     """
     Gemini API 整合服務（整合進 unified 結構）：
@@ -53,9 +204,16 @@ class GeminiService:
     def __init__(self, outputs_dir: Optional[str] = None, settings_json_path: Optional[str] = None) -> None:
         self.base_dir = Path.cwd()
         
-        # Prioritize passed outputs_dir, then default to a path within the project structure
-        if outputs_dir:
-            self.outputs_dir = Path(outputs_dir)
+        # Prioritize passed outputs_dir, then default to a path within the project structure.
+        # 也接受帶 .path 的共享參照（_DirRef），之後都 lazy 讀最新值
+        if outputs_dir is not None and hasattr(outputs_dir, "path"):
+            self._outputs_ref = outputs_dir
+        elif outputs_dir:
+            self._outputs_ref = _DirRef(Path(outputs_dir))
+        else:
+            self._outputs_ref = None
+
+        if self._outputs_ref is not None:
             # Infer static_dir from outputs_dir (e.g., .../apps/web/static/outputs -> .../apps/web/static)
             if self.outputs_dir.name == "outputs" and self.outputs_dir.parent.name == "static":
                 self.static_dir = self.outputs_dir.parent
@@ -64,8 +222,8 @@ class GeminiService:
         else:
             # Fallback to legacy path structure
             self.static_dir = self.base_dir / "app" / "static"
-            self.outputs_dir = self.static_dir / "outputs"
-        
+            self._outputs_ref = _DirRef(self.static_dir / "outputs")
+
         self.outputs_dir.mkdir(parents=True, exist_ok=True)
         
         # Initialize logger
@@ -84,8 +242,30 @@ class GeminiService:
         self._settings_path: Optional[str] = settings_json_path
         self._settings_mtime: Optional[float] = None
 
+        # 每執行緒重用的編碼緩衝區，避免熱路徑反覆配置大塊 BytesIO
+        self._tls = threading.local()
+
+        # 背景工作池：refine 等 best-effort 後續步驟不佔用請求執行緒
+        self._api_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="gemini-bg")
+
+        # 附圖讀檔專用池：與 _api_pool 分開，refine 工作（在 _api_pool 上跑）
+        # 再進 _invoke_gemini_api 時才不會等自己佔住的 worker 而卡死
+        self._read_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="gemini-read")
+
+        # 對外 Gemini 呼叫的併發上限；ROI/分析並行後避免同時打爆配額
+        self._gemini_sem = threading.BoundedSemaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "5") or "5"))
+
         self._load_settings(settings_json_path)
 
+    @property
+    def outputs_dir(self) -> Path:
+        return self._outputs_ref.path
+
+    @outputs_dir.setter
+    def outputs_dir(self, value) -> None:
+        # 直接指定路徑時改用私有參照，不回寫上游共享的 ref
+        self._outputs_ref = value if hasattr(value, "path") else _DirRef(Path(value))
+
     def _load_settings(self, settings_json_path: Optional[str] = None):
         """
         Loads settings from a JSON file and falls back to environment variables.
@@ -280,7 +460,7 @@ class GeminiService:
             if image_base64:
                 print(f"[GeminiService] extracted base64 image data, length={len(image_base64)}")
                 with open(output_path, "wb") as out_img:
-                    out_img.write(base64.b64decode(image_base64))
+                    out_img.write(_b64decode(image_base64))
                 print(f"[GeminiService] wrote api-b64 to {output_path}")
                 self._optional_refine_steps(str(output_path), garment_image_abs, user_image_path)
                 return {"status": "ok", "mode": "api", "output_path": public_path, "message": None}
@@ -585,7 +765,7 @@ class GeminiService:
                             image_base64_b = self._extract_image_data(result_dict_b)
                             if image_base64_b:
                                 with open(output_path, "wb") as out_img:
-                                    out_img.write(base64.b64decode(image_base64_b))
+                                    out_img.write(_b64decode(image_base64_b))
                                 self._run_final_identity_check(str(user_image_path), str(output_path))
                                 return {"status": "ok", "mode": "two_stage_fallback", "output_path": public_path, "message": None}
                         except Exception:
@@ -604,7 +784,7 @@ class GeminiService:
             if image_base64:
                 print(f"[GeminiService] TWO-STAGE: Extracted base64 image data")
                 with open(output_path, "wb") as out_img:
-                    out_img.write(base64.b64decode(image_base64))
+                    out_img.write(_b64decode(image_base64))
                 print(f"[GeminiService] TWO-STAGE: Wrote image to {output_path}")
                 self._run_final_identity_check(str(user_image_path), str(output_path))
                 return {"status": "ok", "mode": "two_stage", "output_path": public_path, "message": None}
@@ -768,7 +948,21 @@ class GeminiService:
         # CRITICAL: Always pass the hairstyle image for visual extraction
         # For hairstyle try-on, we MUST show AI the hairstyle photo (even if it has a model)
         if garment_path and garment_path.exists():
-            g_mime, g_bytes = self._read_image_as_supported_bytes(str(garment_path))
+            g_bytes = None
+            g_mime = None
+            pre_read = garment.get("image_bytes") if isinstance(garment, dict) else None
+            if pre_read is not None:
+                mime = self._detect_mime_type(str(garment_path))
+                if mime in self.SUPPORTED_MIME_TYPES:
+                    try:
+                        # TryOnService 以 mmap 附上檔案內容，直接取用、不再讀磁碟；
+                        # mmap 被 LRU 淘汰關閉時取用會失敗，退回一般讀檔
+                        g_bytes = bytes(pre_read)
+                        g_mime = mime
+                    except Exception:
+                        g_bytes = None
+            if g_bytes is None:
+                g_mime, g_bytes = self._read_image_as_supported_bytes(str(garment_path))
             parts.append({"inline_data": {"mime_type": g_mime, "data": base64.b64encode(g_bytes).decode("utf-8")}})
             print(f"[GeminiService] SIMPLE: Added hairstyle photo (Image 2) - path={garment_path}, mime_type={g_mime}, size={len(g_bytes)} bytes")
         else:
@@ -848,7 +1042,7 @@ class GeminiService:
         image_base64 = self._extract_image_data(result_dict)
         if image_base64:
             with open(output_path, "wb") as out_img:
-                out_img.write(base64.b64decode(image_base64))
+                out_img.write(_b64decode(image_base64))
             print(f"[GeminiService] SIMPLE: Wrote base64 image to {output_path}")
             return {"status": "ok", "mode": "simple", "output_path": public_path, "message": None}
 
@@ -1490,19 +1684,24 @@ class GeminiService:
                 roi_bytes = buf.getvalue()
             parts = [{"text": stage2_prompt}, {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(roi_bytes).decode("utf-8")}}]
             if garment_image_abs and os.path.exists(garment_image_abs):
-                g_mime, g_bytes = self._read_image_as_supported_bytes(garment_image_abs)
-                parts.append({"inline_data": {"mime_type": g_mime, "data": base64.b64encode(g_bytes).decode("utf-8")}})
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents={"parts": parts},
-                config={"safety_settings": safety_settings},
-            )
+                g_b64 = self._load_resized_b64(garment_image_abs)
+                if g_b64:
+                    parts.append({"inline_data": {"mime_type": "image/jpeg", "data": g_b64}})
+                else:
+                    g_mime, g_bytes = self._read_image_as_supported_bytes(garment_image_abs)
+                    parts.append({"inline_data": {"mime_type": g_mime, "data": base64.b64encode(g_bytes).decode("utf-8")}})
+            with self._gemini_sem:
+                response = self.client.models.generate_content(
+                    model=self.model_name,
+                    contents={"parts": parts},
+                    config={"safety_settings": safety_settings},
+                )
             print("[GeminiService] TWO-STAGE: Attempting to extract image bytes from ROI response")
             out_bytes = self._extract_image_bytes_from_sdk(response)
             if not out_bytes:
                 result_dict = self._response_to_dict(response)
                 b64 = self._extract_image_data(result_dict)
-                out_bytes = base64.b64decode(b64) if b64 else None
+                out_bytes = _b64decode(b64) if b64 else None
             if out_bytes:
                 with Image.open(user_image_path).convert("RGB") as base2:
                     w2, h2 = base2.size
@@ -1542,19 +1741,24 @@ class GeminiService:
                 roi_bytes = buf.getvalue()
             parts = [{"text": stage2_prompt}, {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(roi_bytes).decode("utf-8")}}]
             if garment_image_abs and os.path.exists(garment_image_abs):
-                g_mime, g_bytes = self._read_image_as_supported_bytes(garment_image_abs)
-                parts.append({"inline_data": {"mime_type": g_mime, "data": base64.b64encode(g_bytes).decode("utf-8")}})
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents={"parts": parts},
-                config={"safety_settings": safety_settings},
-            )
+                g_b64 = self._load_resized_b64(garment_image_abs)
+                if g_b64:
+                    parts.append({"inline_data": {"mime_type": "image/jpeg", "data": g_b64}})
+                else:
+                    g_mime, g_bytes = self._read_image_as_supported_bytes(garment_image_abs)
+                    parts.append({"inline_data": {"mime_type": g_mime, "data": base64.b64encode(g_bytes).decode("utf-8")}})
+            with self._gemini_sem:
+                response = self.client.models.generate_content(
+                    model=self.model_name,
+                    contents={"parts": parts},
+                    config={"safety_settings": safety_settings},
+                )
             print("[GeminiService] TWO-STAGE: Attempting to extract image bytes from upper-body ROI response")
             out_bytes = self._extract_image_bytes_from_sdk(response)
             if not out_bytes:
                 result_dict = self._response_to_dict(response)
                 b64 = self._extract_image_data(result_dict)
-                out_bytes = base64.b64decode(b64) if b64 else None
+                out_bytes = _b64decode(b64) if b64 else None
             if out_bytes:
                 with Image.open(user_image_path).convert("RGB") as base2:
                     w2, h2 = base2.size
@@ -1705,14 +1909,19 @@ class GeminiService:
             image_part = genai_types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
             parts = [prompt_part, image_part]
             try:
+                aux_paths = []
                 if garment_image_abs and os.path.exists(garment_image_abs):
-                    g_mime, g_bytes = self._read_image_as_supported_bytes(garment_image_abs)
-                    parts.append(genai_types.Part.from_bytes(data=g_bytes, mime_type=g_mime))
-                if extra_image_paths:
-                    for p in extra_image_paths:
-                        if p and os.path.exists(p):
-                            e_mime, e_bytes = self._read_image_as_supported_bytes(p)
-                            parts.append(genai_types.Part.from_bytes(data=e_bytes, mime_type=e_mime))
+                    aux_paths.append(garment_image_abs)
+                for p in (extra_image_paths or []):
+                    if p and os.path.exists(p):
+                        aux_paths.append(p)
+                if len(aux_paths) >= 2:
+                    # 多張附圖同時送讀以重疊磁碟等待；單張直接讀，省去排程成本
+                    payloads = list(self._read_pool.map(self._read_image_as_supported_bytes, aux_paths))
+                else:
+                    payloads = [self._read_image_as_supported_bytes(p) for p in aux_paths]
+                for a_mime, a_bytes in payloads:
+                    parts.append(genai_types.Part.from_bytes(data=a_bytes, mime_type=a_mime))
             except Exception:
                 pass
             contents = [genai_types.Content(role="user", parts=parts)]
@@ -1785,18 +1994,22 @@ class GeminiService:
             # Call with timeout guard to avoid worker blocking
             timeout_s = int(os.getenv("GEMINI_API_TIMEOUT", "60") or "60")
             print(f"[GeminiService] API call starting, timeout={timeout_s}s model={self.model_name}")
+            def _call_gated():
+                with self._gemini_sem:
+                    if cfg is not None:
+                        return self.client.models.generate_content(model=self.model_name, contents=contents, config=cfg)  # type: ignore[union-attr]
+                    return self.client.models.generate_content(model=self.model_name, contents=contents)  # type: ignore[union-attr]
+
             ex = concurrent.futures.ThreadPoolExecutor(max_workers=1)
             try:
-                if cfg is not None:
-                    fut = ex.submit(lambda: self.client.models.generate_content(model=self.model_name, contents=contents, config=cfg))  # type: ignore[union-attr]
-                else:
-                    fut = ex.submit(lambda: self.client.models.generate_content(model=self.model_name, contents=contents))  # type: ignore[union-attr]
+                fut = ex.submit(_call_gated)
                 result = fut.result(timeout=timeout_s)
                 print(f"[GeminiService] API call completed, result type={type(result).__name__}")
-                if result:
-                    print(f"[GeminiService] API result has {len(str(result))} chars in repr")
+                # str(result) 會序列化整份回應（含影像 bytes），僅在 DEBUG 等級才做
+                if result and self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("API result has %d chars in repr", len(str(result)))
                     if hasattr(result, '__dict__'):
-                        print(f"[GeminiService] API result attributes: {list(result.__dict__.keys())}")
+                        self.logger.debug("API result attributes: %s", list(result.__dict__.keys()))
                 return result
             except concurrent.futures.TimeoutError:
                 print(f"[GeminiService] API call TIMEOUT after {timeout_s}s")
@@ -1860,10 +2073,15 @@ class GeminiService:
                         new_w = max(1, int(round(w * scale)))
                         new_h = max(1, int(round(h * scale)))
                         im = im.convert("RGB").resize((new_w, new_h), Image.LANCZOS)
-                        buf = BytesIO()
+                        if _turbo_jpeg is not None and _np is not None:
+                            try:
+                                # libjpeg-turbo 走 SIMD 編碼，較 PIL 內建 encoder 快數倍
+                                return ("image/jpeg", _turbo_jpeg.encode(_np.asarray(im), quality=90, pixel_format=TJPF_RGB))
+                            except Exception:
+                                pass
+                        buf = self._get_buf()
                         im.save(buf, format="JPEG", quality=90)
-                        buf.seek(0)
-                        return ("image/jpeg", buf.read())
+                        return ("image/jpeg", buf.getvalue())
                 except Exception:
                     return self._read_image_as_supported_bytes(path)
 
@@ -1950,12 +2168,48 @@ class GeminiService:
             return None
         return None
 
+    @functools.cached_property
+    def _analysis_service(self) -> TryOnAnalysisService:
+        return TryOnAnalysisService(self)
+
+    def _load_resized_b64(self, path: str, max_edge: int = 1024) -> Optional[str]:
+        """將影像長邊縮至 max_edge 再回傳 base64 字串，縮小 API payload 與回傳 token。"""
+        if Image is None:
+            return None
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            return _resized_b64_cached(path, mtime_ns, max_edge)
+        except Exception:
+            return None
+
+    def _get_buf(self) -> BytesIO:
+        """取得目前執行緒重用的 BytesIO（已清空）。"""
+        buf = getattr(self._tls, "buf", None)
+        if buf is None:
+            buf = BytesIO()
+            self._tls.buf = buf
+        else:
+            buf.seek(0)
+            buf.truncate(0)
+        return buf
+
     def _optional_refine_steps(self, generated_image_path: str, garment_image_abs: Optional[str], original_user_image_path: Optional[str] = None) -> None:
+        """refine 屬 best-effort 後處理，丟到背景池執行，主結果立即回傳。"""
         if os.getenv("GEMINI_REFINE_REMOVE_BASE", "0") == "1":
-            refined_bytes = self._refine_remove_original_clothes(generated_image_path, garment_image_abs, original_user_image_path)
+            fut = self._api_pool.submit(
+                self._refine_remove_original_clothes, generated_image_path, garment_image_abs, original_user_image_path
+            )
+            fut.add_done_callback(lambda f: self._maybe_write_refined(f, generated_image_path))
+
+    def _maybe_write_refined(self, fut: "concurrent.futures.Future", generated_image_path: str) -> None:
+        try:
+            refined_bytes = fut.result()
             if refined_bytes:
                 with open(generated_image_path, "wb") as out_img:
                     out_img.write(refined_bytes)
+                print(f"[GeminiService] background refine wrote {generated_image_path}")
+        except Exception as exc:
+            print(f"[GeminiService] background refine skipped: {type(exc).__name__}: {exc}")
 
     def _prepare_image_payload(self, image_path: str) -> Tuple[str, bytes]:
         mime_type = self._detect_mime_type(image_path)
@@ -1965,10 +2219,9 @@ class GeminiService:
         if mime_type not in self.SUPPORTED_MIME_TYPES:
             with Image.open(image_path) as img:
                 rgb_image = img.convert("RGB")
-                buffer = BytesIO()
+                buffer = self._get_buf()
                 rgb_image.save(buffer, format="JPEG", quality=95)
-                buffer.seek(0)
-                return "image/jpeg", buffer.read()
+                return "image/jpeg", buffer.getvalue()
         with open(image_path, "rb") as image_file:
             return mime_type, image_file.read()
 
@@ -1984,10 +2237,9 @@ class GeminiService:
                 except Exception:
                     pass
                 rgb_image = img.convert("RGB")
-                buffer = BytesIO()
+                buffer = self._get_buf()
                 rgb_image.save(buffer, format="JPEG", quality=95)
-                buffer.seek(0)
-                return "image/jpeg", buffer.read()
+                return "image/jpeg", buffer.getvalue()
         with open(image_path, "rb") as f:
             return mime_type, f.read()
 
@@ -2020,8 +2272,12 @@ class GeminiService:
 
     @staticmethod
     def _detect_mime_type(file_path: str) -> str:
-        mime_type, _ = mimetypes.guess_type(file_path)
-        return mime_type or "image/jpeg"
+        mime = _EXT_MIME.get(os.path.splitext(file_path)[1].lower())
+        if mime is None:
+            # 表外副檔名（.tiff/.svg/.ico…）回退 mimetypes 判斷，
+            # 讓不支援的格式走 PIL 轉 JPEG，而不是誤標成 image/jpeg 原樣送出
+            mime, _ = mimetypes.guess_type(file_path)
+        return mime or "image/jpeg"
 
     @staticmethod
     def _response_to_dict(result: Any) -> Dict[str, Any]:
@@ -2155,98 +2411,29 @@ class GeminiService:
                 return direct_bytes
             image_b64 = self._extract_image_data(result_dict)
             if image_b64:
-                return base64.b64decode(image_b64)
-        except Exception:
+                return _b64decode(image_b64)
+        except (OSError, binascii.Error):
+            # 檔案讀取或 base64 解碼失敗視為 refine 失敗；其餘例外交由呼叫端記錄
             return None
         return None
 
     def _build_prompt(self, garment: Any, user_note: Optional[str] = None) -> str:
-        try:
-            has_garment = False
-            if isinstance(garment, list):
-                for g in garment:
-                    if (g or {}).get("image_path"):
-                        has_garment = True
-                        break
-            elif garment and isinstance(garment, dict):
-                has_garment = bool(garment.get("image_path"))
-        except Exception:
-            has_garment = False
-
-        base = (
-            "PROFESSIONAL E-COMMERCE TASK: Digital fashion photography composite for online retail.\n"
-            "\n"
-            "Context: Standard commercial workflow - digitally edit customer photo to show product garment fit.\n"
-            "\n"
-            "Task: Replace existing clothing with product garment using digital editing.\n"
-            "\n"
-            "Process:\n"
-            "1. INPUT ANALYSIS\n"
-            "   - Image 1 (customer): person in original outfit + background scene\n"
-            "   - Image 2 (product): garment to be applied (ignore any models)\n"
-            "\n"
-            "2. IDENTIFY GARMENT TYPE from image 2:\n"
-            "   - If SWIMWEAR/BRIEFS/ATHLETIC SHORTS: This is lower-body athletic wear\n"
-            "   - If TOP/SHIRT/JACKET: This is upper-body wear\n"
-            "   - If DRESS/JUMPSUIT: This is full-body wear\n"
-            "\n"
-            "3. DIGITAL EDITING WORKFLOW:\n"
-            "   Step A: For SWIMWEAR/BRIEFS (athletic lower-body garment):\n"
-            "     - Edit hip/waist/leg regions in image 1\n"
-            "     - Replace existing fabric in those regions with new garment from image 2\n"
-            "     - Result visual: Person wearing athletic swimwear as seen in professional swim/sports photography\n"
-            "     - Body contours visible per garment coverage (standard for athletic wear)\n"
-            "   \n"
-            "   Step B: For TOPS/SHIRTS:\n"
-            "     - Edit chest/shoulder/arm regions in image 1\n"
-            "     - Replace existing fabric with new garment from image 2\n"
-            "   \n"
-            "   Step C: For FULL-BODY garments:\n"
-            "     - Edit full torso regions in image 1\n"
-            "     - Replace existing fabric with new garment from image 2\n"
-            "\n"
-            "4. CRITICAL QUALITY CHECK:\n"
-            "   ✓ New garment matches body pose, lighting, perspective\n"
-            "   ✓ Background/face/hair unchanged from image 1\n"
-            "   ✓ MOST IMPORTANT: No old garment visible in edited regions\n"
-            "   \n"
-            "   VISUAL VERIFICATION for SWIMWEAR example:\n"
-            "   ❌ WRONG: Old pants/shorts still visible under new swimwear\n"
-            "   ❌ WRONG: Old shirt still covering torso above new swimwear\n"
-            "   ✓ CORRECT: Only new swimwear visible in hip/leg area, other areas show body form\n"
-            "   ✓ CORRECT: Result looks like person originally photographed wearing the swimwear\n"
-            "\n"
-            "CRITICAL: This is complete garment REPLACEMENT. \n"
-            "Think: 'What would this photo look like if person wore ONLY the new garment from the start?'\n"
-            "NOT: 'Add new garment on top of existing clothes'\n"
-            "YES: 'Edit photo so new garment is the ONLY clothing in target area'\n"
-            "\n"
-            "For athletic/swimwear: Standard sports/swim photography aesthetic - garment fitted to body form (normal for this product category).\n"
-            "\n"
-            "Output: Image 1's scene with person edited to wear ONLY image 2's garment (as if originally photographed that way).\n"
-        )
+        if isinstance(garment, list):
+            has_garment = any(isinstance(g, dict) and g.get("image_path") for g in garment)
+        else:
+            has_garment = bool(isinstance(garment, dict) and garment.get("image_path"))
 
-        custom_section = ""
-        if user_note:
-            note_clean = user_note.strip()
-            if note_clean:
-                custom_section = (
-                    "USER PRIORITY REQUEST:\n"
-                    f"- {note_clean}\n"
-                    "Honor this styling request while producing the final outfit. Adjust garment fit, posing, or emphasis to satisfy the user's note without changing the person's identity.\n\n"
-                )
+        note_clean = user_note.strip() if user_note else ""
+        if not note_clean:
+            # 絕大多數呼叫沒有 user_note：直接回傳預組變體，零串接
+            return _PROMPT_VARIANTS[has_garment]
+        return self._compose_prompt(has_garment, note_clean)
 
-        if has_garment:
-            extra = (
-                " Use the GARMENT REFERENCE(s) as the clothing to be worn by the user in the USER PHOTO. Ensure correct placement of collars, sleeves, hems, necklines, waistbands, and closures. "
-                "If the USER PHOTO is half-body, compose the garment as a half-body result; if full-body, ensure full garment visibility when possible. "
-                "Blend edges cleanly; avoid ghosting or doubled clothes. Do NOT change the user's identity or pose."
-            )
-        else:
-            extra = (
-                " If no garment reference is available, return a clean enhancement of the user photo maintaining realism (as a fallback)."
-            )
-        return custom_section + base + extra
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _compose_prompt(has_garment: bool, note_clean: str) -> str:
+        """純函式的提示組裝；retry/ROI 重複呼叫時直接命中快取。"""
+        return _USER_NOTE_TEMPLATE.format(note=note_clean) + _PROMPT_VARIANTS[has_garment]
 
     @staticmethod
     def _check_safety_ratings(response: Any) -> Optional[str]:
@@ -2262,24 +2449,21 @@ class GeminiService:
             
             blocked_reasons = []
             for idx, candidate in enumerate(candidates):
+                finish_reason, safety_ratings = _get_cand(candidate)
+
                 # Check finish_reason
-                finish_reason = getattr(candidate, "finish_reason", None)
-                finish_reason_str = str(finish_reason)
-                
                 # IMAGE_OTHER is not an error, it means image was generated successfully
                 # Only treat SAFETY, RECITATION, and similar as actual blocks
-                if finish_reason and finish_reason_str not in ("STOP", "1", "", "FinishReason.IMAGE_OTHER", "IMAGE_OTHER"):
-                    # Check if it's actually a blocking reason
-                    if any(keyword in finish_reason_str.upper() for keyword in ["SAFETY", "RECITATION", "PROHIBITED", "BLOCKED"]):
+                if finish_reason:
+                    fr = str(finish_reason).upper()
+                    if fr not in _SAFE_FINISH and any(keyword in fr for keyword in _BLOCKING_KEYWORDS):
                         blocked_reasons.append(f"candidate[{idx}].finish_reason={finish_reason}")
-                
+
                 # Check safety_ratings
-                safety_ratings = getattr(candidate, "safety_ratings", None) or []
-                for rating in safety_ratings:
-                    category = getattr(rating, "category", "UNKNOWN")
-                    probability = getattr(rating, "probability", "UNKNOWN")
+                for rating in (safety_ratings or ()):
+                    category, probability = _get_rating(rating)
                     # If probability is HIGH or MEDIUM, log it
-                    if probability and str(probability) in ("HIGH", "MEDIUM", "3", "2"):
+                    if probability and str(probability) in _HIGH_PROB:
                         blocked_reasons.append(f"{category}={probability}")
             
             if blocked_reasons:
@@ -2300,36 +2484,71 @@ class GeminiService:
         needs_upper: bool,
         needs_lower: bool,
     ) -> Optional[Dict[str, Optional[str]]]:
+        roi_prompt = stage2_prompt + _ROI_SINGLE_USER_SUFFIX
+
+        if needs_lower and needs_upper and Image is not None:
+            # 兩個 ROI 互不依賴，各自以原圖為基底並行生成，完成後在本地合成，
+            # 總延遲由兩次 API 往返縮成一次
+            tmp_upper = output_path.with_name(f"{output_path.stem}_roi_upper{output_path.suffix}")
+            ex = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+            try:
+                fut_lower = ex.submit(self._generate_on_lower_body_roi, base_image_path, garment_image_abs, roi_prompt, safety_settings, public_path, output_path)
+                fut_upper = ex.submit(self._generate_on_upper_body_roi, base_image_path, garment_image_abs, roi_prompt, safety_settings, public_path, tmp_upper)
+                roi_lower = fut_lower.result()
+                roi_upper = fut_upper.result()
+            finally:
+                ex.shutdown(wait=False)
+
+            result: Optional[Dict[str, Optional[str]]] = roi_lower
+            if roi_upper:
+                if roi_lower:
+                    try:
+                        with Image.open(output_path).convert("RGB") as merged:
+                            w, h = merged.size
+                            l, t, r, b = self._compute_upper_body_roi(w, h)
+                            with Image.open(tmp_upper).convert("RGB") as upper_img:
+                                merged.paste(upper_img.crop((l, t, r, b)), (l, t))
+                                merged.save(output_path, format="JPEG", quality=92)
+                    except Exception:
+                        pass
+                else:
+                    try:
+                        shutil.move(str(tmp_upper), str(output_path))
+                        result = roi_upper
+                    except Exception:
+                        result = None
+            try:
+                if tmp_upper.exists():
+                    tmp_upper.unlink()
+            except Exception:
+                pass
+            return result
+
+        # 只需要單一 ROI 時維持原本的序列流程
         current_base = base_image_path
-        result: Optional[Dict[str, Optional[str]]] = None
+        result = None
         if needs_lower:
-            roi_prompt = (
-                stage2_prompt
-                + "\nEnsure the edited region produces a single continuous frame featuring only the original user; do NOT copy or paste any other person from any reference image."
-            )
             roi_lower = self._generate_on_lower_body_roi(current_base, garment_image_abs, roi_prompt, safety_settings, public_path, output_path)
             if roi_lower:
                 result = roi_lower
                 current_base = str(output_path)
         if needs_upper:
-            roi_prompt = (
-                stage2_prompt
-                + "\nEnsure the edited region produces a single continuous frame featuring only the original user; do NOT copy or paste any other person from any reference image."
-            )
             roi_upper = self._generate_on_upper_body_roi(current_base, garment_image_abs, roi_prompt, safety_settings, public_path, output_path)
             if roi_upper:
                 result = roi_upper
-                current_base = str(output_path)
         return result
 
     def _run_final_identity_check(self, user_image_path: str, output_path: str) -> None:
         try:
-            print("[GeminiService] FINAL CHECK: ensure output preserves user identity")
-            self._analysis_service = getattr(self, "_analysis_service", TryOnAnalysisService(self))
-            user_info = self._analysis_service.analyze_user(Path(user_image_path))
-            output_info = self._analysis_service.analyze_user(Path(output_path))
+            self.logger.info("FINAL CHECK: ensure output preserves user identity")
+            # 兩張圖的分析互不相依，並行送出讓兩個 RTT 重疊
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as ex:
+                fut_user = ex.submit(self._analysis_service.analyze_user, Path(user_image_path))
+                fut_output = ex.submit(self._analysis_service.analyze_user, Path(output_path))
+                user_info = fut_user.result()
+                output_info = fut_output.result()
             if user_info.get("summary") and output_info.get("summary"):
-                print(f"[GeminiService] FINAL CHECK: user={user_info['summary']} output={output_info['summary']}")
+                self.logger.info("FINAL CHECK: user=%s output=%s", user_info["summary"], output_info["summary"])
         except Exception as exc:
-            print(f"[GeminiService] FINAL CHECK skipped due to error: {exc}")
+            self.logger.info("FINAL CHECK skipped due to error: %s", exc)
 
@@ -4,9 +4,13 @@ Based on https://app.klingai.com/global/dev/document-api/apiReference/model/func
 Authentication uses JWT (JSON Web Token, RFC 7519)
 """
 import base64
+import concurrent.futures
+import functools
 import json
 import logging
 import os
+import random
+import shutil
 import time
 from io import BytesIO
 from pathlib import Path
@@ -27,6 +31,53 @@ try:
 except Exception:
     jwt = None  # type: ignore
 
+try:
+    import pybase64  # type: ignore  # SIMD base64，多 MB 圖片編解碼快數倍
+except Exception:  # pragma: no cover
+    pybase64 = None  # type: ignore
+
+try:
+    import orjson  # type: ignore  # C 實作 JSON，輪詢迴圈中解析快 2-5 倍
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps_bytes = orjson.dumps
+else:
+    _json_loads = json.loads
+
+    def _json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+
+def _b64encode_str(data) -> str:
+    """base64 編碼為 str；pybase64 可用時走 SIMD 路徑。"""
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode("ascii")
+
+
+def _b64decode_bytes(data) -> bytes:
+    if pybase64 is not None:
+        return pybase64.b64decode(data, validate=False)
+    return base64.b64decode(data)
+
+
+@functools.lru_cache(maxsize=128)
+def _cached_garment_b64(svc: "KlingAIService", path: str, size: int, mtime_ns: int) -> Optional[str]:
+    """服飾圖來自固定目錄且極少變動；以 (path, size, mtime) 為鍵快取 base64。"""
+    return svc._image_to_base64(path)
+
+
+class _DirRef:
+    """輸出目錄的可變參照；共享同一個 ref 的服務讀 .path 都拿到最新目錄。"""
+
+    __slots__ = ("path",)
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
 
 class KlingAIService:
     """
@@ -39,6 +90,10 @@ class KlingAIService:
     API_BASE_URL = "https://api.klingai.com"
     SUPPORTED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
 
+    # 這些格式 API 原生支援，檔案不大時直接送原始 bytes，跳過 PIL 解碼/再編碼
+    PASSTHROUGH_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+    PASSTHROUGH_MAX_BYTES = 4 * 1024 * 1024
+
     def __init__(self, outputs_dir: Optional[str] = None, settings_json_path: Optional[str] = None) -> None:
         self.base_dir = Path.cwd()
         
@@ -57,95 +112,198 @@ class KlingAIService:
         
         # Always use the passed outputs_dir parameter when available
         # Default to apps/web/static/outputs for consistency with other services
-        if outputs_dir:
-            self.outputs_dir = Path(outputs_dir)
+        # 也接受帶 .path 的共享參照（_DirRef），上游換目錄時免再逐一傳播
+        if outputs_dir is not None and hasattr(outputs_dir, "path"):
+            self._outputs_ref = outputs_dir
+        elif outputs_dir:
+            self._outputs_ref = _DirRef(Path(outputs_dir))
         else:
-            self.outputs_dir = self.static_dir / "outputs"
-        
+            self._outputs_ref = _DirRef(self.static_dir / "outputs")
+
         self.outputs_dir.mkdir(parents=True, exist_ok=True)
-        print(f"[KlingAIService] Static directory: {self.static_dir}")
-        print(f"[KlingAIService] Output directory: {self.outputs_dir}")
-        
+
         # Initialize logger
         self.logger = logging.getLogger(__name__)
+        self.logger.info("Static directory: %s", self.static_dir)
+        self.logger.info("Output directory: %s", self.outputs_dir)
         
         self.access_key: Optional[str] = None
         self.secret_key: Optional[str] = None
         self.model: str = "kolors-virtual-try-on-v1"  # Default model
+
+        # 共用連線池：對 api.klingai.com 重用 keep-alive 連線，
+        # 避免每次請求／輪詢都重新 TCP + TLS 握手
+        self._session = None
+        if requests is not None:
+            self._session = requests.Session()
+            try:
+                from requests.adapters import HTTPAdapter, Retry
+
+                self._session.mount(
+                    "https://",
+                    HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=16,
+                        max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+                    ),
+                )
+            except Exception:
+                pass
+            self._session.headers["Content-Type"] = "application/json"
+
+        # 影像編碼用的長駐小工作池；PIL 與 base64 的 C 實作會釋放 GIL
+        self._io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="klingai-io")
+
+        # 服飾路徑的搜尋根目錄（目錄佈局執行期不變）與解析結果快取
+        self._search_roots = []
+        for root in (self.static_dir, self.base_dir / "app" / "static", self.base_dir / "apps" / "web" / "static"):
+            if root.exists() and root not in self._search_roots:
+                self._search_roots.append(root)
+        if not self._search_roots:
+            self._search_roots = [self.static_dir]
+        self._path_cache: Dict[str, str] = {}
         
         # Settings tracking for hot-reload
         self._settings_path: Optional[str] = settings_json_path
         self._settings_mtime: Optional[float] = None
+        # (size, mtime_ns) 指紋 + 節流時間戳：穩態下每 2 秒最多 stat 一次
+        self._settings_fp: Optional[Tuple[int, int]] = None
+        self._settings_last_check: float = 0.0
+
+        # JWT token 快取 (token, exp)：token 有效 30 分鐘，毋須每次請求重簽
+        self._jwt_cache: Optional[Tuple[str, int]] = None
+
+        # KlingAI 相關鍵值的摘要；reload 時相同則完全跳過狀態更新
+        self._settings_digest: Optional[int] = None
+
+        # API 端點固定不變，建構一次即可
+        self._tryon_url = self.API_BASE_URL + "/v1/images/kolors-virtual-try-on"
+        self._tryon_task_prefix = self._tryon_url + "/"
 
         self._load_settings(settings_json_path)
 
+    @property
+    def outputs_dir(self) -> Path:
+        return self._outputs_ref.path
+
+    @outputs_dir.setter
+    def outputs_dir(self, value) -> None:
+        # 直接指定路徑時換成私有參照，不影響上游共享的 ref
+        self._outputs_ref = value if hasattr(value, "path") else _DirRef(Path(value))
+
     def _load_settings(self, settings_json_path: Optional[str] = None):
         """
         Loads settings from a JSON file and falls back to environment variables.
         """
         settings = {}
         path_to_load = None
+        st = None
 
         # Priority 1: Use the path explicitly passed to the service
-        if settings_json_path and Path(settings_json_path).exists():
-            path_to_load = Path(settings_json_path)
-        
+        # （單一 os.stat 同時檢查存在性並取得 hot-reload 指紋）
+        if settings_json_path:
+            try:
+                st = os.stat(settings_json_path)
+                path_to_load = Path(settings_json_path)
+            except OSError:
+                st = None
+
         # Priority 2: Fallback to the default path if the explicit one isn't provided/valid
-        else:
+        if path_to_load is None:
             default_path = self.base_dir / "data" / "settings.json"
-            if default_path.exists():
+            try:
+                st = os.stat(default_path)
                 path_to_load = default_path
+            except OSError:
+                st = None
 
         # Track the settings file path and modification time for hot-reload
         if path_to_load:
             self._settings_path = str(path_to_load)
-            try:
-                self._settings_mtime = path_to_load.stat().st_mtime
-            except Exception:
+            if st is not None:
+                self._settings_mtime = st.st_mtime
+                self._settings_fp = (st.st_size, st.st_mtime_ns)
+            else:
                 self._settings_mtime = None
+                self._settings_fp = None
         
         # Load from the determined path
         if path_to_load:
             try:
                 settings = json.loads(path_to_load.read_text(encoding="utf-8"))
             except Exception as e:
-                print(f"[KlingAIService] Error loading settings from {path_to_load}: {e}")
+                self.logger.warning("Error loading settings from %s: %s", path_to_load, e)
                 settings = {}
 
+        self._settings_digest = hash(
+            (settings.get("KLINGAI_ACCESS_KEY"), settings.get("KLINGAI_SECRET_KEY"), settings.get("KLINGAI_MODEL"))
+        )
+
         # Load values, falling back from settings to environment variables
         self.access_key = settings.get("KLINGAI_ACCESS_KEY") or os.getenv("KLINGAI_ACCESS_KEY")
         self.secret_key = settings.get("KLINGAI_SECRET_KEY") or os.getenv("KLINGAI_SECRET_KEY")
         self.model = settings.get("KLINGAI_MODEL") or os.getenv("KLINGAI_MODEL") or "kolors-virtual-try-on-v1"
 
         if self.access_key and self.secret_key:
-            print(f"[KlingAIService] Keys loaded successfully: access_key={self.access_key[:10]}...")
-            print(f"[KlingAIService] Using model: {self.model}")
+            self.logger.info("Keys loaded successfully: access_key=%s...", self.access_key[:10])
+            self.logger.info("Using model: %s", self.model)
         else:
             if not self.access_key:
-                print("[KlingAIService] No access key found in settings or environment")
+                self.logger.warning("No access key found in settings or environment")
             if not self.secret_key:
-                print("[KlingAIService] No secret key found in settings or environment")
+                self.logger.warning("No secret key found in settings or environment")
+
+    def close(self) -> None:
+        """釋放連線池資源。"""
+        if self._session is not None:
+            try:
+                self._session.close()
+            except Exception:
+                pass
+
+    def __del__(self):  # pragma: no cover - best-effort cleanup
+        self.close()
 
     def _reload_settings_if_changed(self) -> None:
         """Hot-reload settings if file has changed"""
         try:
             if not self._settings_path:
                 return
-            if not Path(self._settings_path).exists():
+            # 節流：同一秒內的多個請求不重複打檔案系統
+            now = time.monotonic()
+            if now - self._settings_last_check < 2.0:
+                return
+            self._settings_last_check = now
+            # 單一 os.stat 同時負責存在性檢查與指紋，省一次 syscall
+            try:
+                st = os.stat(self._settings_path)
+            except FileNotFoundError:
                 return
-            mtime = Path(self._settings_path).stat().st_mtime
-            if self._settings_mtime and mtime <= self._settings_mtime:
+            fp = (st.st_size, st.st_mtime_ns)
+            if self._settings_fp is not None and fp == self._settings_fp:
                 return
-            
+
             data = json.loads(Path(self._settings_path).read_text(encoding="utf-8"))
+            self._settings_mtime = st.st_mtime
+            self._settings_fp = fp
+
+            # settings.json 由多個服務共用；只有 KlingAI 的三個鍵變動時才更新狀態，
+            # 其他服務的設定改動不應使 JWT 快取失效
+            new_digest = hash((data.get("KLINGAI_ACCESS_KEY"), data.get("KLINGAI_SECRET_KEY"), data.get("KLINGAI_MODEL")))
+            if new_digest == self._settings_digest:
+                return
+            self._settings_digest = new_digest
+
             old_access, old_secret, old_model = self.access_key, self.secret_key, self.model
             self.access_key = data.get("KLINGAI_ACCESS_KEY") or self.access_key
             self.secret_key = data.get("KLINGAI_SECRET_KEY") or self.secret_key
             self.model = data.get("KLINGAI_MODEL") or self.model
-            self._settings_mtime = mtime
-            
+
+            if (self.access_key != old_access) or (self.secret_key != old_secret):
+                # 金鑰換了，快取的 token 不再有效
+                self._jwt_cache = None
             if (self.access_key != old_access) or (self.secret_key != old_secret) or (self.model != old_model):
-                print(f"[KlingAIService] Settings reloaded (model: {self.model})")
+                self.logger.info("Settings reloaded (model: %s)", self.model)
         except Exception:
             # swallow errors to avoid breaking requests
             pass
@@ -156,14 +314,18 @@ class KlingAIService:
         Follows JWT (JSON Web Token, RFC 7519) standard
         """
         if not jwt:
-            print("[KlingAIService] Warning: PyJWT library not available")
+            self.logger.warning("PyJWT library not available")
             return ""
         
         if not self.access_key or not self.secret_key:
-            print("[KlingAIService] Warning: Missing access_key or secret_key for JWT generation")
+            self.logger.warning("Missing access_key or secret_key for JWT generation")
             return ""
-        
+
         current_time = int(time.time())
+
+        # 距離過期超過 5 分鐘就重用快取的 token
+        if self._jwt_cache and self._jwt_cache[1] - 300 > current_time:
+            return self._jwt_cache[0]
         
         # JWT Header
         headers = {
@@ -181,10 +343,11 @@ class KlingAIService:
         try:
             # Generate JWT token
             token = jwt.encode(payload, self.secret_key, algorithm="HS256", headers=headers)
-            print(f"[KlingAIService] JWT token generated successfully (expires in 30min)")
+            self._jwt_cache = (token, current_time + 1800)
+            self.logger.debug("JWT token generated successfully (expires in 30min)")
             return token
         except Exception as e:
-            print(f"[KlingAIService] Error generating JWT token: {e}")
+            self.logger.warning("Error generating JWT token: %s", e)
             return ""
 
     def _get_headers(self) -> Dict[str, str]:
@@ -198,37 +361,65 @@ class KlingAIService:
         
         return headers
 
+    def _resolve_garment_path(self, rel: str) -> Optional[str]:
+        """將相對的服飾圖路徑解析為絕對路徑；命中過的結果直接從快取取回。
+
+        解析失敗不進快取，後續上傳的新服飾仍可被找到。
+        """
+        rel_clean = str(rel).strip("/")
+        if rel_clean.startswith("static/"):
+            rel_clean = rel_clean[len("static/"):]
+
+        cached = self._path_cache.get(rel_clean)
+        if cached is not None:
+            return cached
+
+        resolved = next((str(root / rel_clean) for root in self._search_roots if (root / rel_clean).exists()), None)
+        if resolved is not None:
+            self._path_cache[rel_clean] = resolved
+        return resolved
+
     def _image_to_base64(self, image_path: str) -> Optional[str]:
         """
         Convert image file to base64 string
         Note: KlingAI requires base64 string WITHOUT data URI prefix
         """
         try:
-            if not Path(image_path).exists():
+            path = Path(image_path)
+            try:
+                file_size = path.stat().st_size
+            except FileNotFoundError:
                 return None
-            
+
+            # Fast path: already a supported format at a reasonable size,
+            # send the raw bytes and skip the PIL decode/re-encode round trip
+            if path.suffix.lower() in self.PASSTHROUGH_SUFFIXES and file_size <= self.PASSTHROUGH_MAX_BYTES:
+                return _b64encode_str(path.read_bytes())
+
             # Read and optionally convert to JPEG if needed
             if Image:
                 with Image.open(image_path) as img:
                     # Convert to RGB if needed
                     if img.mode not in ('RGB', 'RGBA'):
                         img = img.convert('RGB')
-                    
+
+                    # Oversized sources get downscaled before re-encoding
+                    if file_size > self.PASSTHROUGH_MAX_BYTES:
+                        img.thumbnail((2048, 2048), Image.LANCZOS)
+
                     # Save to BytesIO buffer
                     buffer = BytesIO()
                     img.save(buffer, format='JPEG', quality=95)
-                    buffer.seek(0)
-                    image_bytes = buffer.read()
-            else:
-                # Fallback: just read the file
-                with open(image_path, 'rb') as f:
-                    image_bytes = f.read()
-            
-            # Convert to base64 - NO data URI prefix per KlingAI API docs
-            base64_str = base64.b64encode(image_bytes).decode('utf-8')
-            return base64_str
+
+                # 直接把底層 buffer 交給編碼器，省掉 read() 的整份複製
+                # Convert to base64 - NO data URI prefix per KlingAI API docs
+                return _b64encode_str(buffer.getbuffer())
+
+            # Fallback: just read the file
+            with open(image_path, 'rb') as f:
+                return _b64encode_str(f.read())
         except Exception as e:
-            print(f"[KlingAIService] Error converting image to base64: {e}")
+            self.logger.warning("Error converting image to base64: %s", e)
             return None
 
     def generate_virtual_tryon(
@@ -263,74 +454,54 @@ class KlingAIService:
 
         # Check API credentials
         if not self.access_key or not self.secret_key:
-            print(f"[KlingAIService] generate_virtual_tryon: API keys are missing")
+            self.logger.warning("generate_virtual_tryon: API keys are missing")
             return {"status": "error", "mode": "unavailable", "output_path": None, "message": "KlingAI API keys not configured"}
 
         if not requests:
-            print(f"[KlingAIService] generate_virtual_tryon: requests library not available")
+            self.logger.warning("generate_virtual_tryon: requests library not available")
             return {"status": "error", "mode": "unavailable", "output_path": None, "message": "HTTP library not available"}
 
         # Extract garment image path
         garment_image_path = None
-        print(f"[KlingAIService] Resolving garment path from: {garment}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Resolving garment path from: %s", garment)
         try:
             if isinstance(garment, dict):
                 g_rel = garment.get("image_path")
-                print(f"[KlingAIService] Garment relative path: {g_rel}")
-                if g_rel:
-                    # Try to resolve relative path
-                    rel_clean = str(g_rel).strip("/")
-                    if rel_clean.startswith("static/"):
-                        rel_clean = rel_clean[len("static/"):]
-                    
-                    print(f"[KlingAIService] Cleaned relative path: {rel_clean}")
-                    
-                    # Try static dir first
-                    candidate = self.static_dir / rel_clean
-                    print(f"[KlingAIService] Trying: {candidate} (exists: {candidate.exists()})")
-                    if candidate.exists():
-                        garment_image_path = str(candidate)
-                    else:
-                        # Try app/static
-                        candidate2 = self.base_dir / "app" / "static" / rel_clean
-                        print(f"[KlingAIService] Trying: {candidate2} (exists: {candidate2.exists()})")
-                        if candidate2.exists():
-                            garment_image_path = str(candidate2)
-                        else:
-                            # Try apps/web/static
-                            candidate3 = self.base_dir / "apps" / "web" / "static" / rel_clean
-                            print(f"[KlingAIService] Trying: {candidate3} (exists: {candidate3.exists()})")
-                            if candidate3.exists():
-                                garment_image_path = str(candidate3)
             elif isinstance(garment, list) and len(garment) > 0:
                 # Handle list of garments, take first one
                 g_rel = (garment[0] or {}).get("image_path")
-                if g_rel:
-                    rel_clean = str(g_rel).strip("/")
-                    if rel_clean.startswith("static/"):
-                        rel_clean = rel_clean[len("static/"):]
-                    candidate = self.static_dir / rel_clean
-                    if candidate.exists():
-                        garment_image_path = str(candidate)
+            else:
+                g_rel = None
+            if g_rel:
+                garment_image_path = self._resolve_garment_path(g_rel)
         except Exception as e:
-            print(f"[KlingAIService] Error resolving garment path: {e}")
-            import traceback
-            traceback.print_exc()
+            # 熱路徑：非 DEBUG 時不建構 traceback，僅留一行警告
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.exception("Error resolving garment path")
+            else:
+                self.logger.warning("Error resolving garment path: %s", e)
 
-        print(f"[KlingAIService] Final garment_image_path: {garment_image_path}")
+        self.logger.debug("Final garment_image_path: %s", garment_image_path)
         
         if not garment_image_path or not Path(garment_image_path).exists():
-            print(f"[KlingAIService] ❌ Garment image not found!")
-            print(f"[KlingAIService]    garment_image_path: {garment_image_path}")
-            print(f"[KlingAIService]    Path exists: {Path(garment_image_path).exists() if garment_image_path else 'N/A'}")
+            self.logger.warning("Garment image not found: %s", garment_image_path)
             return {"status": "error", "mode": "error", "output_path": None, "message": "Garment image not found"}
 
         try:
             # Convert images to base64
-            print(f"[KlingAIService] Converting images to base64...")
-            user_base64 = self._image_to_base64(user_image_path)
-            garment_base64 = self._image_to_base64(garment_image_path)
-            
+            self.logger.debug("Converting images to base64...")
+            # 兩張圖互不相依，丟進工作池並行編碼；
+            # 服飾圖走 LRU 快取（使用者照每次不同，不快取）
+            fut_user = self._io_pool.submit(self._image_to_base64, user_image_path)
+            try:
+                g_st = os.stat(garment_image_path)
+                fut_garment = self._io_pool.submit(_cached_garment_b64, self, garment_image_path, g_st.st_size, g_st.st_mtime_ns)
+            except OSError:
+                fut_garment = self._io_pool.submit(self._image_to_base64, garment_image_path)
+            user_base64 = fut_user.result()
+            garment_base64 = fut_garment.result()
+
             if not user_base64 or not garment_base64:
                 return {"status": "error", "mode": "error", "output_path": None, "message": "Failed to process images"}
 
@@ -342,22 +513,22 @@ class KlingAIService:
                 "cloth_image": garment_base64,
             }
             
-            print(f"[KlingAIService] Using model: {self.model}")
+            self.logger.debug("Using model: %s", self.model)
             
             headers = self._get_headers()
-            
-            # Debug: Log headers (mask sensitive data)
-            headers_debug = {k: (v[:20] + "..." if len(v) > 20 and k in ["Authorization", "X-Signature"] else v) 
-                           for k, v in headers.items()}
-            print(f"[KlingAIService] Request headers: {headers_debug}")
-            print(f"[KlingAIService] Calling KlingAI API for session={session_ref}")
+
+            if self.logger.isEnabledFor(logging.DEBUG):
+                # Debug: Log headers (mask sensitive data)
+                headers_debug = {k: (v[:20] + "..." if len(v) > 20 and k in ["Authorization", "X-Signature"] else v)
+                                 for k, v in headers.items()}
+                self.logger.debug("Request headers: %s", headers_debug)
+            self.logger.info("Calling KlingAI API for session=%s", session_ref)
             
             # Call KlingAI API
-            api_url = f"{self.API_BASE_URL}/v1/images/kolors-virtual-try-on"
-            response = requests.post(
-                api_url,
+            response = self._session.post(
+                self._tryon_url,
                 headers=headers,
-                json=payload,
+                data=_json_dumps_bytes(payload),  # Content-Type 已設在 session headers
                 timeout=60
             )
             
@@ -365,30 +536,30 @@ class KlingAIService:
             if response.status_code != 200:
                 error_msg = f"KlingAI API error: {response.status_code}"
                 try:
-                    error_data = response.json()
+                    error_data = _json_loads(response.content)
                     error_msg = error_data.get("message", error_msg)
-                    print(f"[KlingAIService] Full error response: {error_data}")
+                    self.logger.warning("Full error response: %s", error_data)
                 except Exception:
-                    print(f"[KlingAIService] Response text: {response.text[:200]}")
-                print(f"[KlingAIService] API error: {error_msg}")
+                    self.logger.warning("Response text: %s", response.text[:200])
+                self.logger.warning("API error: %s", error_msg)
                 return {"status": "error", "mode": "api_error", "output_path": None, "message": error_msg}
             
             # Parse response
-            result = response.json()
-            print(f"[KlingAIService] API response received")
-            print(f"[KlingAIService] Full response: {result}")
+            result = _json_loads(response.content)
+            self.logger.debug("API response received")
+            self.logger.debug("Full response: %s", result)
             
             # Extract task ID for polling (if async)
             task_id = result.get("data", {}).get("task_id")
             if task_id:
                 # KlingAI uses async processing, need to poll for result
-                print(f"[KlingAIService] Task created: {task_id}, polling for result...")
+                self.logger.info("Task created: %s, polling for result...", task_id)
                 final_result = self._poll_task_result(task_id, timeout=120)
                 if not final_result:
                     return {"status": "error", "mode": "timeout", "output_path": None, "message": "Task timeout"}
                 result = final_result
             else:
-                print(f"[KlingAIService] No task_id found in response, checking for immediate result...")
+                self.logger.debug("No task_id found in response, checking for immediate result...")
             
             # Extract image URL or base64
             image_url = None
@@ -409,7 +580,7 @@ class KlingAIService:
                     images = task_result.get("images", [])
                     if images and len(images) > 0:
                         image_url = images[0].get("url")
-                        print(f"[KlingAIService] Found image URL in task_result.images: {image_url}")
+                        self.logger.debug("Found image URL in task_result.images: %s", image_url)
                     
                     # Try works array format (alternative format)
                     if not image_url:
@@ -417,52 +588,56 @@ class KlingAIService:
                         if works and len(works) > 0:
                             resource = works[0].get("resource", {})
                             image_url = resource.get("resource")
-                            print(f"[KlingAIService] Found image URL in task_result.works: {image_url}")
+                            self.logger.debug("Found image URL in task_result.works: %s", image_url)
             
             if image_url:
                 # Download image from URL
-                print(f"[KlingAIService] Downloading result from URL: {image_url}")
-                img_response = requests.get(image_url, timeout=30)
-                print(f"[KlingAIService] Download response: {img_response.status_code}, size: {len(img_response.content)} bytes")
-                
-                if img_response.status_code == 200:
-                    with open(output_path, 'wb') as f:
-                        f.write(img_response.content)
-                    
-                    # Verify file was written
-                    import os
-                    file_size = os.path.getsize(output_path)
-                    print(f"[KlingAIService] Result saved to {output_path}")
-                    print(f"[KlingAIService] File size: {file_size} bytes")
-                    print(f"[KlingAIService] Public path: {public_path}")
-                    
-                    return {"status": "ok", "mode": "klingai", "output_path": public_path, "message": None}
-                else:
-                    print(f"[KlingAIService] Download failed: HTTP {img_response.status_code}")
-                    return {"status": "error", "mode": "download_error", "output_path": None, "message": f"Failed to download image: HTTP {img_response.status_code}"}
+                self.logger.debug("Downloading result from URL: %s", image_url)
+                # 串流寫盤：bytes 從 socket 直接進檔案，不在記憶體組整張圖
+                with self._session.get(image_url, timeout=30, stream=True) as img_response:
+                    content_length = img_response.headers.get("Content-Length", "?")
+                    self.logger.debug("Download response: %s, size: %s bytes", img_response.status_code, content_length)
+
+                    if img_response.status_code == 200:
+                        # raw 不會自動解 Content-Encoding，壓縮回應需先開 decode
+                        img_response.raw.decode_content = True
+                        with open(output_path, 'wb') as f:
+                            shutil.copyfileobj(img_response.raw, f, length=64 * 1024)
+                    else:
+                        self.logger.warning("Download failed: HTTP %s", img_response.status_code)
+                        return {"status": "error", "mode": "download_error", "output_path": None, "message": f"Failed to download image: HTTP {img_response.status_code}"}
+
+                # Verify file was written
+                file_size = output_path.stat().st_size
+                self.logger.info("Result saved to %s (%d bytes)", output_path, file_size)
+                self.logger.debug("Public path: %s", public_path)
+
+                return {"status": "ok", "mode": "klingai", "output_path": public_path, "message": None}
             elif image_data:
                 # Decode base64 image
-                print(f"[KlingAIService] Decoding base64 result...")
+                self.logger.debug("Decoding base64 result...")
                 # Remove data URL prefix if present
                 if "," in image_data:
                     image_data = image_data.split(",", 1)[1]
-                image_bytes = base64.b64decode(image_data)
+                image_bytes = _b64decode_bytes(image_data)
                 with open(output_path, 'wb') as f:
                     f.write(image_bytes)
-                print(f"[KlingAIService] Result saved to {output_path}")
+                self.logger.info("Result saved to %s", output_path)
                 return {"status": "ok", "mode": "klingai", "output_path": public_path, "message": None}
             
-            print(f"[KlingAIService] No image in response")
+            self.logger.warning("No image in response")
             return {"status": "error", "mode": "no_image", "output_path": None, "message": "KlingAI API 未返回圖片"}
 
         except requests.exceptions.Timeout:
-            print(f"[KlingAIService] API timeout")
+            self.logger.warning("API timeout")
             return {"status": "error", "mode": "timeout", "output_path": None, "message": "KlingAI API 請求超時"}
         except Exception as exc:
-            print(f"[KlingAIService] Exception: {type(exc).__name__}: {exc}")
-            import traceback
-            traceback.print_exc()
-            return {"status": "error", "mode": "error", "output_path": None, "message": f"{type(exc).__name__}: {exc}"}
+            err_msg = f"{type(exc).__name__}: {exc}"
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.exception("KlingAI request failed")
+            else:
+                self.logger.warning("KlingAI request failed: %s", err_msg)
+            return {"status": "error", "mode": "error", "output_path": None, "message": err_msg}
 
     def _poll_task_result(self, task_id: str, timeout: int = 120) -> Optional[Dict]:
         """
@@ -479,53 +654,57 @@ class KlingAIService:
             return None
             
         start_time = time.time()
-        poll_interval = 2  # Poll every 2 seconds
+        # 指數退避：1s → 1.5s → … 封頂 8s，外加抖動，快完成的任務仍能即時接住
+        interval = 1.0
         
-        api_url = f"{self.API_BASE_URL}/v1/images/kolors-virtual-try-on/{task_id}"
+        api_url = self._tryon_task_prefix + task_id
         
         poll_count = 0
         while time.time() - start_time < timeout:
             try:
                 poll_count += 1
                 headers = self._get_headers()
-                response = requests.get(api_url, headers=headers, timeout=10)
+                response = self._session.get(api_url, headers=headers, timeout=10)
                 
                 if response.status_code != 200:
-                    print(f"[KlingAIService] Poll #{poll_count}: HTTP {response.status_code}")
+                    self.logger.warning("Poll #%d: HTTP %s", poll_count, response.status_code)
                     try:
-                        error_data = response.json()
-                        print(f"[KlingAIService] Error response: {error_data}")
+                        error_data = _json_loads(response.content)
+                        self.logger.warning("Error response: %s", error_data)
                     except:
-                        print(f"[KlingAIService] Response text: {response.text[:200]}")
-                    time.sleep(poll_interval)
+                        self.logger.warning("Response text: %s", response.text[:200])
+                    time.sleep(interval + random.uniform(0, 0.25))
+                    interval = min(interval * 1.5, 8.0)
                     continue
                 
-                result = response.json()
+                result = _json_loads(response.content)
                 # KlingAI uses "task_status" not "status"
                 task_status = result.get("data", {}).get("task_status")
                 
                 # Log every 5th poll or when status changes
                 if poll_count % 5 == 1 or task_status not in ("processing", "pending", "submitted"):
-                    print(f"[KlingAIService] Poll #{poll_count} (elapsed {int(time.time() - start_time)}s): task_status={task_status}")
+                    self.logger.debug("Poll #%d (elapsed %ds): task_status=%s", poll_count, int(time.time() - start_time), task_status)
                     if poll_count == 1:
-                        print(f"[KlingAIService] Full response: {result}")
+                        self.logger.debug("Full response: %s", result)
                 
                 if task_status in ("completed", "succeed", "success"):
-                    print(f"[KlingAIService] Task {task_id} completed after {poll_count} polls")
-                    print(f"[KlingAIService] Final result: {result}")
+                    self.logger.info("Task %s completed after %d polls", task_id, poll_count)
+                    self.logger.debug("Final result: %s", result)
                     return result
                 elif task_status in ("failed", "error"):
-                    print(f"[KlingAIService] Task {task_id} failed: {result.get('message')}")
-                    print(f"[KlingAIService] Error details: {result}")
+                    self.logger.warning("Task %s failed: %s", task_id, result.get('message'))
+                    self.logger.debug("Error details: %s", result)
                     return None
                 
                 # Still processing
-                time.sleep(poll_interval)
-                
+                time.sleep(interval + random.uniform(0, 0.25))
+                interval = min(interval * 1.5, 8.0)
+
             except Exception as e:
-                print(f"[KlingAIService] Polling error #{poll_count}: {e}")
-                time.sleep(poll_interval)
+                self.logger.warning("Polling error #%d: %s", poll_count, e)
+                time.sleep(interval + random.uniform(0, 0.25))
+                interval = min(interval * 1.5, 8.0)
         
-        print(f"[KlingAIService] Task {task_id} timeout after {timeout}s")
+        self.logger.warning("Task %s timeout after %ds", task_id, timeout)
         return None
 
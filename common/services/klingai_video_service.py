@@ -3,13 +3,19 @@ KlingAI Video Generation Service
 Based on https://app.klingai.com/global/dev/document-api/apiReference/model/imageToVideo
 Authentication uses JWT (JSON Web Token, RFC 7519)
 """
+import asyncio
 import base64
 import json
 import logging
 import os
+import random
+import shutil
 import time
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Optional
+from uuid import uuid4
+from typing import Any, Dict, List, Optional, Tuple
 
 try:
     import requests  # type: ignore
@@ -21,6 +27,51 @@ try:
 except Exception:
     jwt = None  # type: ignore
 
+try:
+    import httpx  # type: ignore  # 非同步 HTTP client（選用）
+except Exception:
+    httpx = None  # type: ignore
+
+try:
+    import orjson  # type: ignore  # C 實作 JSON；大 payload（含 base64 圖）序列化快數倍
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps_bytes = orjson.dumps
+else:
+    _json_loads = json.loads
+
+    def _json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+
+@dataclass(frozen=True, slots=True)
+class KlingSettings:
+    """單一不可變設定物件；reload 時整份替換，請求中途不會讀到半套設定。"""
+
+    access_key: Optional[str]
+    secret_key: Optional[str]
+    model: str
+    mode: str
+    duration: int
+    # turbo 判斷在建構時算一次，熱路徑不再做 lower() + 子字串掃描
+    is_turbo: bool = False
+
+    def __post_init__(self):
+        object.__setattr__(self, "is_turbo", "turbo" in self.model.lower())
+
+
+@lru_cache(maxsize=32)
+def _encode_image_b64(path: str, mtime: float, size: int) -> str:
+    """來源圖（多為換裝結果）重送時毋須重讀重編碼；以 (path, mtime, size) 為鍵。
+
+    b64encode 輸出保證是 ASCII，decode('ascii') 比 utf-8 少一次掃描；
+    原始 bytes 不留額外參照，編碼後即可回收。
+    """
+    return base64.b64encode(Path(path).read_bytes()).decode('ascii')
+
 
 class KlingAIVideoService:
     """
@@ -40,6 +91,7 @@ class KlingAIVideoService:
         "kling-v2-1-master": "Kling v2.1 Master",
         "kling-v2-5-turbo": "Kling v2.5 Turbo 快速版",
     }
+    _SUPPORTED = frozenset(SUPPORTED_VIDEO_MODELS)
 
     def __init__(self, outputs_dir: Optional[str] = None, settings_json_path: Optional[str] = None) -> None:
         self.base_dir = Path.cwd()
@@ -62,24 +114,72 @@ class KlingAIVideoService:
             self.outputs_dir = self.static_dir / "outputs"
         
         self.outputs_dir.mkdir(parents=True, exist_ok=True)
-        print(f"[KlingAIVideoService] Static directory: {self.static_dir}")
-        print(f"[KlingAIVideoService] Output directory: {self.outputs_dir}")
-        
+
         # Initialize logger
         self.logger = logging.getLogger(__name__)
+        self.logger.info("Static directory: %s", self.static_dir)
+        self.logger.info("Output directory: %s", self.outputs_dir)
         
-        self.access_key: Optional[str] = None
-        self.secret_key: Optional[str] = None
-        self.model: str = "kling-v1"  # Default model
-        self.mode: str = "std"  # Default mode: std or pro
-        self.duration: int = 5  # Default duration in seconds
-        
+        # 設定統一放在 self._cfg；既有呼叫端仍可經由下方 property 讀取
+        self._cfg = KlingSettings(None, None, "kling-v1", "std", 5)
+
+        # 共用連線池：submit／輪詢／下載都打同一個 host，
+        # 重用 keep-alive 連線省下每次的 TCP + TLS 握手
+        self._session = None
+        if requests is not None:
+            self._session = requests.Session()
+            try:
+                from requests.adapters import HTTPAdapter, Retry
+
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=16,
+                    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+                )
+                self._session.mount("https://", adapter)
+                self._session.mount("http://", adapter)
+            except Exception:
+                pass
+
         # Settings tracking for hot-reload
         self._settings_path: Optional[str] = settings_json_path
         self._settings_mtime: Optional[float] = None
 
+        # JWT token 快取 (token, exp)：token 有效 30 分鐘，輪詢時毋須每次重簽
+        self._jwt_cache: Optional[tuple] = None
+
+        # 非同步 client 延遲建立（需在事件迴圈內初始化）
+        self._aclient = None
+
         self._load_settings(settings_json_path)
 
+        # 以檔案系統事件取代每請求 stat()；watchdog 缺席時退回 mtime 輪詢
+        self._settings_dirty = False
+        self._settings_observer = None
+        if self._settings_path:
+            self._start_settings_observer()
+
+    # 舊介面相容層：各欄位讀取都指向目前的設定快照
+    @property
+    def access_key(self) -> Optional[str]:
+        return self._cfg.access_key
+
+    @property
+    def secret_key(self) -> Optional[str]:
+        return self._cfg.secret_key
+
+    @property
+    def model(self) -> str:
+        return self._cfg.model
+
+    @property
+    def mode(self) -> str:
+        return self._cfg.mode
+
+    @property
+    def duration(self) -> int:
+        return self._cfg.duration
+
     def _load_settings(self, settings_json_path: Optional[str] = None):
         """
         Loads settings from a JSON file and falls back to environment variables.
@@ -110,30 +210,80 @@ class KlingAIVideoService:
             try:
                 settings = json.loads(path_to_load.read_text(encoding="utf-8"))
             except Exception as e:
-                print(f"[KlingAIVideoService] Error loading settings from {path_to_load}: {e}")
+                self.logger.warning("Error loading settings from %s: %s", path_to_load, e)
                 settings = {}
 
         # Load values, falling back from settings to environment variables
-        self.access_key = settings.get("KLINGAI_VIDEO_ACCESS_KEY") or os.getenv("KLINGAI_VIDEO_ACCESS_KEY")
-        self.secret_key = settings.get("KLINGAI_VIDEO_SECRET_KEY") or os.getenv("KLINGAI_VIDEO_SECRET_KEY")
-        self.model = settings.get("KLINGAI_VIDEO_MODEL") or os.getenv("KLINGAI_VIDEO_MODEL") or "kling-v1"
-        self.mode = settings.get("KLINGAI_VIDEO_MODE") or os.getenv("KLINGAI_VIDEO_MODE") or "std"
-        self.duration = int(settings.get("KLINGAI_VIDEO_DURATION") or os.getenv("KLINGAI_VIDEO_DURATION") or "5")
+        self._cfg = KlingSettings(
+            access_key=settings.get("KLINGAI_VIDEO_ACCESS_KEY") or os.getenv("KLINGAI_VIDEO_ACCESS_KEY"),
+            secret_key=settings.get("KLINGAI_VIDEO_SECRET_KEY") or os.getenv("KLINGAI_VIDEO_SECRET_KEY"),
+            model=settings.get("KLINGAI_VIDEO_MODEL") or os.getenv("KLINGAI_VIDEO_MODEL") or "kling-v1",
+            mode=settings.get("KLINGAI_VIDEO_MODE") or os.getenv("KLINGAI_VIDEO_MODE") or "std",
+            duration=int(settings.get("KLINGAI_VIDEO_DURATION") or os.getenv("KLINGAI_VIDEO_DURATION") or "5"),
+        )
 
         if self.access_key and self.secret_key:
-            print(f"[KlingAIVideoService] Keys loaded successfully: access_key={self.access_key[:10]}...")
-            print(f"[KlingAIVideoService] Using model: {self.model}, mode: {self.mode}, duration: {self.duration}s")
+            self.logger.info("Keys loaded successfully: access_key=%s...", self.access_key[:10])
+            self.logger.info("Using model: %s, mode: %s, duration: %ss", self.model, self.mode, self.duration)
         else:
             if not self.access_key:
-                print("[KlingAIVideoService] No access key found in settings or environment")
+                self.logger.warning("No access key found in settings or environment")
             if not self.secret_key:
-                print("[KlingAIVideoService] No secret key found in settings or environment")
+                self.logger.warning("No secret key found in settings or environment")
+
+    def _start_settings_observer(self) -> None:
+        """監看 settings.json 所在目錄；收到修改事件才標記 dirty。"""
+        try:
+            from watchdog.events import PatternMatchingEventHandler  # type: ignore
+            from watchdog.observers import Observer  # type: ignore
+        except Exception:
+            return
+        try:
+            settings_file = Path(self._settings_path)
+            service = self
+
+            class _SettingsChanged(PatternMatchingEventHandler):
+                def on_modified(self, event):
+                    service._settings_dirty = True
+
+                on_created = on_modified
+                on_moved = on_modified
+
+            observer = Observer()
+            observer.daemon = True
+            # watchdog 以完整路徑做 fnmatch，裸檔名比不中，要加 * 前綴
+            observer.schedule(_SettingsChanged(patterns=[f"*{settings_file.name}"]), str(settings_file.parent))
+            observer.start()
+            self._settings_observer = observer
+        except Exception:
+            self._settings_observer = None
+
+    def close(self) -> None:
+        """釋放連線池資源。"""
+        if self._session is not None:
+            try:
+                self._session.close()
+            except Exception:
+                pass
+        if self._settings_observer is not None:
+            try:
+                self._settings_observer.stop()
+            except Exception:
+                pass
+
+    def __del__(self):  # pragma: no cover - best-effort cleanup
+        self.close()
 
     def _reload_settings_if_changed(self) -> None:
         """Hot-reload settings if file has changed"""
         try:
             if not self._settings_path:
                 return
+            if self._settings_observer is not None:
+                # 事件驅動：沒有 dirty 旗標就不打檔案系統
+                if not self._settings_dirty:
+                    return
+                self._settings_dirty = False
             if not Path(self._settings_path).exists():
                 return
             mtime = Path(self._settings_path).stat().st_mtime
@@ -141,16 +291,24 @@ class KlingAIVideoService:
                 return
             
             data = json.loads(Path(self._settings_path).read_text(encoding="utf-8"))
-            old_access, old_secret, old_model, old_mode, old_duration = self.access_key, self.secret_key, self.model, self.mode, self.duration
-            self.access_key = data.get("KLINGAI_VIDEO_ACCESS_KEY") or self.access_key
-            self.secret_key = data.get("KLINGAI_VIDEO_SECRET_KEY") or self.secret_key
-            self.model = data.get("KLINGAI_VIDEO_MODEL") or self.model
-            self.mode = data.get("KLINGAI_VIDEO_MODE") or self.mode
-            self.duration = int(data.get("KLINGAI_VIDEO_DURATION") or self.duration)
+            old = self._cfg
+            new_cfg = KlingSettings(
+                access_key=data.get("KLINGAI_VIDEO_ACCESS_KEY") or old.access_key,
+                secret_key=data.get("KLINGAI_VIDEO_SECRET_KEY") or old.secret_key,
+                model=data.get("KLINGAI_VIDEO_MODEL") or old.model,
+                mode=data.get("KLINGAI_VIDEO_MODE") or old.mode,
+                duration=int(data.get("KLINGAI_VIDEO_DURATION") or old.duration),
+            )
             self._settings_mtime = mtime
-            
-            if (self.access_key != old_access) or (self.secret_key != old_secret) or (self.model != old_model) or (self.mode != old_mode) or (self.duration != old_duration):
-                print(f"[KlingAIVideoService] Settings reloaded (model: {self.model}, mode: {self.mode}, duration: {self.duration}s)")
+            if new_cfg == old:
+                return
+            self._cfg = new_cfg  # atomic swap
+
+            if (new_cfg.access_key != old.access_key) or (new_cfg.secret_key != old.secret_key):
+                # 金鑰換了，快取的 token 不再有效
+                self._jwt_cache = None
+
+            self.logger.info("Settings reloaded (model: %s, mode: %s, duration: %ss)", new_cfg.model, new_cfg.mode, new_cfg.duration)
         except Exception:
             # swallow errors to avoid breaking requests
             pass
@@ -161,46 +319,57 @@ class KlingAIVideoService:
         Follows JWT (JSON Web Token, RFC 7519) standard
         """
         if not jwt:
-            print("[KlingAIVideoService] Warning: PyJWT library not available")
+            self.logger.warning("PyJWT library not available")
             return ""
         
         if not self.access_key or not self.secret_key:
-            print("[KlingAIVideoService] Warning: Missing access_key or secret_key for JWT generation")
+            self.logger.warning("Missing access_key or secret_key for JWT generation")
             return ""
         
         current_time = int(time.time())
-        
+
+        # 距離過期超過 1 分鐘就重用快取的 token，避免每次輪詢都做 HMAC 簽章
+        if self._jwt_cache is not None and self._jwt_cache[1] - current_time > 60:
+            return self._jwt_cache[0]
+
         # JWT Header
         headers = {
             "alg": "HS256",
             "typ": "JWT"
         }
-        
+
         # JWT Payload
         payload = {
             "iss": self.access_key,  # Issuer: access key
             "exp": current_time + 1800,  # Expiration: current time + 30 minutes
             "nbf": current_time - 5  # Not before: current time - 5 seconds
         }
-        
+
         try:
             # Generate JWT token
             token = jwt.encode(payload, self.secret_key, algorithm="HS256", headers=headers)
-            print(f"[KlingAIVideoService] JWT token generated successfully (expires in 30min)")
+            self._jwt_cache = (token, current_time + 1800)
+            self.logger.debug("JWT token generated successfully (expires in 30min)")
             return token
         except Exception as e:
-            print(f"[KlingAIVideoService] Error generating JWT token: {e}")
+            self.logger.warning("Error generating JWT token: %s", e)
             return ""
 
     def _get_headers(self) -> Dict[str, str]:
         """Generate authentication headers for KlingAI API"""
         token = self._generate_jwt_token()
-        
+
+        # token 沒換就重用同一個 headers dict；呼叫端（requests/httpx）不會改動它
+        cache = self._jwt_cache
+        if cache is not None and cache[0] == token and len(cache) > 2:
+            return cache[2]
+
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {token}" if token else "",
         }
-        
+        if cache is not None and cache[0] == token:
+            self._jwt_cache = (cache[0], cache[1], headers)
         return headers
 
     def _image_to_base64(self, image_path: str) -> Optional[str]:
@@ -214,25 +383,16 @@ class KlingAIVideoService:
         Incorrect format: data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAUA...
         """
         try:
-            if not Path(image_path).exists():
+            try:
+                st = os.stat(image_path)
+            except FileNotFoundError:
                 return None
-            
-            # Read image file
-            with open(image_path, 'rb') as f:
-                image_bytes = f.read()
-            
+
             # Convert to base64 - NO data URI prefix per KlingAI API docs
-            base64_str = base64.b64encode(image_bytes).decode('utf-8')
-            
-            # Ensure no prefix was accidentally added
-            if base64_str.startswith('data:'):
-                # Remove prefix if present
-                if ',' in base64_str:
-                    base64_str = base64_str.split(',', 1)[1]
-            
-            return base64_str
+            # （同一檔案重複提交時直接命中快取）
+            return _encode_image_b64(image_path, st.st_mtime, st.st_size)
         except Exception as e:
-            print(f"[KlingAIVideoService] Error converting image to base64: {e}")
+            self.logger.warning("Error converting image to base64: %s", e)
             return None
 
     def generate_video(
@@ -261,21 +421,26 @@ class KlingAIVideoService:
         
         # Check API credentials
         if not self.access_key or not self.secret_key:
-            print(f"[KlingAIVideoService] generate_video: API keys are missing")
+            self.logger.warning("generate_video: API keys are missing")
             return {"status": "error", "task_id": None, "output_path": None, "message": "KlingAI Video API keys not configured"}
 
         if not requests:
-            print(f"[KlingAIVideoService] generate_video: requests library not available")
+            self.logger.warning("generate_video: requests library not available")
             return {"status": "error", "task_id": None, "output_path": None, "message": "HTTP library not available"}
 
         # Validate image path
         if not Path(image_path).exists():
-            print(f"[KlingAIVideoService] Image not found: {image_path}")
+            self.logger.warning("Image not found: %s", image_path)
             return {"status": "error", "task_id": None, "output_path": None, "message": "Source image not found"}
 
+        # 未支援的 model 直接擋下，省一趟注定 400 的 API 來回
+        if self.model not in self._SUPPORTED:
+            self.logger.warning("Unsupported video model: %s", self.model)
+            return {"status": "error", "task_id": None, "output_path": None, "message": f"Unsupported video model: {self.model}"}
+
         try:
             # Convert image to base64
-            print(f"[KlingAIVideoService] Converting image to base64...")
+            self.logger.debug("Converting image to base64...")
             image_base64 = self._image_to_base64(image_path)
             
             if not image_base64:
@@ -284,8 +449,9 @@ class KlingAIVideoService:
             # Prepare API request
             # Based on KlingAI Image-to-Video API documentation
             # Reference: https://app.klingai.com/global/dev/document-api/apiReference/model/imageToVideo
+            cfg = self._cfg  # 單次取快照，整個請求看到一致的設定
             payload = {
-                "model_name": self.model,
+                "model_name": cfg.model,
                 "image": image_base64,  # Pure Base64 string, NO data: prefix
                 "prompt": prompt,
                 "duration": str(duration),  # "5" or "10"
@@ -294,31 +460,29 @@ class KlingAIVideoService:
             # Note: Some models (like turbo variants) may not support the 'mode' parameter
             # The support range varies by model version - only add if model supports it
             # Turbo models typically have fixed performance mode
-            if "turbo" not in self.model.lower():
-                payload["mode"] = self.mode  # "std" or "pro"
-                print(f"[KlingAIVideoService] Mode: {self.mode}")
-            else:
-                print(f"[KlingAIVideoService] Mode: (not applicable for turbo model)")
-            
-            print(f"[KlingAIVideoService] Using model: {self.model}")
-            print(f"[KlingAIVideoService] Prompt: {prompt}")
-            print(f"[KlingAIVideoService] Duration: {duration}s")
-            print(f"[KlingAIVideoService] Image Base64 length: {len(image_base64)} chars")
-            
+            if not cfg.is_turbo:
+                payload["mode"] = cfg.mode  # "std" or "pro"
+
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Using model: %s, mode: %s", cfg.model, payload.get("mode", "(n/a for turbo)"))
+                self.logger.debug("Prompt: %s, duration: %ss", prompt, duration)
+                self.logger.debug("Image Base64 length: %d chars", len(image_base64))
+
             headers = self._get_headers()
-            
-            # Debug: Log headers (mask sensitive data)
-            headers_debug = {k: (v[:20] + "..." if len(v) > 20 and k in ["Authorization"] else v) 
-                           for k, v in headers.items()}
-            print(f"[KlingAIVideoService] Request headers: {headers_debug}")
-            print(f"[KlingAIVideoService] Calling KlingAI Video API for session={session_ref}")
+
+            if self.logger.isEnabledFor(logging.DEBUG):
+                # Debug: Log headers (mask sensitive data)
+                headers_debug = {k: (v[:20] + "..." if len(v) > 20 and k in ["Authorization"] else v)
+                                 for k, v in headers.items()}
+                self.logger.debug("Request headers: %s", headers_debug)
+            self.logger.info("Calling KlingAI Video API for session=%s", session_ref)
             
             # Call KlingAI API
             api_url = f"{self.API_BASE_URL}/v1/videos/image2video"
-            response = requests.post(
+            response = self._session.post(
                 api_url,
                 headers=headers,
-                json=payload,
+                data=_json_dumps_bytes(payload),  # Content-Type 已含在 headers
                 timeout=60
             )
             
@@ -326,26 +490,26 @@ class KlingAIVideoService:
             if response.status_code != 200:
                 error_msg = f"KlingAI Video API error: {response.status_code}"
                 try:
-                    error_data = response.json()
+                    error_data = _json_loads(response.content)
                     error_msg = error_data.get("message", error_msg)
-                    print(f"[KlingAIVideoService] Full error response: {error_data}")
+                    self.logger.warning("Full error response: %s", error_data)
                 except Exception:
-                    print(f"[KlingAIVideoService] Response text: {response.text[:200]}")
-                print(f"[KlingAIVideoService] API error: {error_msg}")
+                    self.logger.warning("Response text: %s", response.text[:200])
+                self.logger.warning("API error: %s", error_msg)
                 return {"status": "error", "task_id": None, "output_path": None, "message": error_msg}
             
             # Parse response
-            result = response.json()
-            print(f"[KlingAIVideoService] API response received")
-            print(f"[KlingAIVideoService] Full response: {result}")
+            result = _json_loads(response.content)
+            self.logger.debug("API response received")
+            self.logger.debug("Full response: %s", result)
             
             # Extract task ID for polling (KlingAI uses async processing)
             task_id = result.get("data", {}).get("task_id")
             if not task_id:
-                print(f"[KlingAIVideoService] No task_id found in response")
+                self.logger.warning("No task_id found in response")
                 return {"status": "error", "task_id": None, "output_path": None, "message": "No task ID returned from API"}
             
-            print(f"[KlingAIVideoService] Video generation task created: {task_id}")
+            self.logger.info("Video generation task created: %s", task_id)
             
             # Return task info for client-side polling
             return {
@@ -356,13 +520,15 @@ class KlingAIVideoService:
             }
 
         except requests.exceptions.Timeout:
-            print(f"[KlingAIVideoService] API timeout")
+            self.logger.warning("API timeout")
             return {"status": "error", "task_id": None, "output_path": None, "message": "KlingAI Video API 請求超時"}
         except Exception as exc:
-            print(f"[KlingAIVideoService] Exception: {type(exc).__name__}: {exc}")
-            import traceback
-            traceback.print_exc()
-            return {"status": "error", "task_id": None, "output_path": None, "message": f"{type(exc).__name__}: {exc}"}
+            err_msg = f"{type(exc).__name__}: {exc}"
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.exception("Video request failed")
+            else:
+                self.logger.warning("Video request failed: %s", err_msg)
+            return {"status": "error", "task_id": None, "output_path": None, "message": err_msg}
 
     def poll_video_task(self, task_id: str) -> Dict[str, Optional[str]]:
         """
@@ -384,23 +550,23 @@ class KlingAIVideoService:
             headers = self._get_headers()
             api_url = f"{self.API_BASE_URL}/v1/videos/image2video/{task_id}"
             
-            response = requests.get(api_url, headers=headers, timeout=10)
+            response = self._session.get(api_url, headers=headers, timeout=10)
             
             if response.status_code != 200:
-                print(f"[KlingAIVideoService] Poll error: HTTP {response.status_code}")
+                self.logger.warning("Poll error: HTTP %s", response.status_code)
                 try:
-                    error_data = response.json()
-                    print(f"[KlingAIVideoService] Error response: {error_data}")
+                    error_data = _json_loads(response.content)
+                    self.logger.warning("Error response: %s", error_data)
                     return {"status": "error", "output_path": None, "message": error_data.get("message", "Polling failed")}
                 except:
-                    print(f"[KlingAIVideoService] Response text: {response.text[:200]}")
+                    self.logger.warning("Response text: %s", response.text[:200])
                     return {"status": "error", "output_path": None, "message": f"HTTP {response.status_code}"}
             
-            result = response.json()
+            result = _json_loads(response.content)
             data = result.get("data", {})
             task_status = data.get("task_status")
             
-            print(f"[KlingAIVideoService] Poll task {task_id}: status={task_status}")
+            self.logger.debug("Poll task %s: status=%s", task_id, task_status)
             
             if task_status in ("succeed", "success"):
                 # Extract video URL
@@ -412,35 +578,33 @@ class KlingAIVideoService:
                     
                     if video_url:
                         # Download video
-                        print(f"[KlingAIVideoService] Downloading video from: {video_url}")
-                        output_filename = f"video_{int(time.time()*1000)}.mp4"
-                        output_path = self.outputs_dir / output_filename
-                        public_path = f"/static/outputs/{output_filename}"
+                        self.logger.debug("Downloading video from: %s", video_url)
+                        output_path, public_path = self._new_video_output()
                         
-                        video_response = requests.get(video_url, timeout=120)
-                        
-                        if video_response.status_code == 200:
+                        # 串流寫盤：影片動輒數十 MB，不在記憶體整份暫存
+                        with self._session.get(video_url, timeout=120, stream=True) as video_response:
+                            if video_response.status_code != 200:
+                                self.logger.warning("Download failed: HTTP %s", video_response.status_code)
+                                return {"status": "error", "output_path": None, "message": f"Failed to download video: HTTP {video_response.status_code}"}
+
+                            video_response.raw.decode_content = True
                             with open(output_path, 'wb') as f:
-                                f.write(video_response.content)
-                            
-                            file_size = output_path.stat().st_size
-                            print(f"[KlingAIVideoService] Video saved to {output_path}")
-                            print(f"[KlingAIVideoService] File size: {file_size} bytes")
-                            
-                            return {
-                                "status": "completed",
-                                "output_path": public_path,
-                                "message": None
-                            }
-                        else:
-                            print(f"[KlingAIVideoService] Download failed: HTTP {video_response.status_code}")
-                            return {"status": "error", "output_path": None, "message": f"Failed to download video: HTTP {video_response.status_code}"}
+                                shutil.copyfileobj(video_response.raw, f, length=64 * 1024)
+
+                        file_size = output_path.stat().st_size
+                        self.logger.info("Video saved to %s (%d bytes)", output_path, file_size)
+
+                        return {
+                            "status": "completed",
+                            "output_path": public_path,
+                            "message": None
+                        }
                 
                 return {"status": "error", "output_path": None, "message": "No video URL in response"}
             
             elif task_status in ("failed", "error"):
                 error_msg = data.get("task_status_msg") or "Video generation failed"
-                print(f"[KlingAIVideoService] Task {task_id} failed: {error_msg}")
+                self.logger.warning("Task %s failed: %s", task_id, error_msg)
                 return {"status": "failed", "output_path": None, "message": error_msg}
             
             elif task_status in ("processing", "submitted", "pending"):
@@ -450,8 +614,169 @@ class KlingAIVideoService:
                 return {"status": "unknown", "output_path": None, "message": f"Unknown status: {task_status}"}
                 
         except Exception as e:
-            print(f"[KlingAIVideoService] Polling error: {e}")
-            import traceback
-            traceback.print_exc()
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.exception("Polling error")
+            else:
+                self.logger.warning("Polling error: %s", e)
             return {"status": "error", "output_path": None, "message": str(e)}
 
+    def _new_video_output(self):
+        """以 uuid 產生不碰撞的輸出檔名，並以前兩個 hex 字元分桶，
+        避免數千個影片擠在同一目錄拖慢檔名查找。"""
+        name = f"video_{uuid4().hex[:16]}.mp4"
+        shard = name[6:8]
+        shard_dir = self.outputs_dir / shard
+        shard_dir.mkdir(exist_ok=True)
+        return shard_dir / name, f"/static/outputs/{shard}/{name}"
+
+    def wait_for_completion(self, task_id: str, timeout: int = 300) -> Dict[str, Optional[str]]:
+        """輪詢直到任務結束或逾時；指數退避 + 抖動，減少無效輪詢。"""
+        delay = 2.0
+        start = time.time()
+        while time.time() - start < timeout:
+            result = self.poll_video_task(task_id)
+            if result.get("status") in ("completed", "failed", "error"):
+                return result
+            time.sleep(delay + random.uniform(0, delay * 0.2))
+            delay = min(delay * 1.5, 15.0)
+        return {"status": "error", "output_path": None, "message": f"Task {task_id} timeout after {timeout}s"}
+
+    def _get_async_client(self):
+        """延遲建立共用的 httpx.AsyncClient；須在事件迴圈內呼叫。"""
+        if httpx is None:
+            return None
+        if self._aclient is None or self._aclient.is_closed:
+            self._aclient = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=60.0,
+            )
+        return self._aclient
+
+    async def aclose(self) -> None:
+        """關閉非同步 client（若曾建立）。"""
+        if self._aclient is not None and not self._aclient.is_closed:
+            await self._aclient.aclose()
+
+    async def agenerate_video(
+        self,
+        image_path: str,
+        prompt: str = "身體旋轉一圈",
+        duration: int = 10,
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Optional[str]]:
+        """generate_video 的非同步版本：等待期間不佔用 worker 執行緒。
+
+        需要安裝 httpx；未安裝時回傳錯誤，呼叫端可退回同步介面。
+        """
+        self._reload_settings_if_changed()
+
+        if not self.access_key or not self.secret_key:
+            return {"status": "error", "task_id": None, "output_path": None, "message": "KlingAI Video API keys not configured"}
+
+        client = self._get_async_client()
+        if client is None:
+            return {"status": "error", "task_id": None, "output_path": None, "message": "httpx not available"}
+
+        if not Path(image_path).exists():
+            return {"status": "error", "task_id": None, "output_path": None, "message": "Source image not found"}
+
+        try:
+            image_base64 = self._image_to_base64(image_path)
+            if not image_base64:
+                return {"status": "error", "task_id": None, "output_path": None, "message": "Failed to process image"}
+
+            cfg = self._cfg
+            payload = {
+                "model_name": cfg.model,
+                "image": image_base64,
+                "prompt": prompt,
+                "duration": str(duration),
+            }
+            if not cfg.is_turbo:
+                payload["mode"] = cfg.mode
+
+            headers = self._get_headers()
+            api_url = f"{self.API_BASE_URL}/v1/videos/image2video"
+            response = await client.post(api_url, headers=headers, json=payload)
+
+            if response.status_code != 200:
+                error_msg = f"KlingAI Video API error: {response.status_code}"
+                try:
+                    error_msg = response.json().get("message", error_msg)
+                except Exception:
+                    pass
+                return {"status": "error", "task_id": None, "output_path": None, "message": error_msg}
+
+            result = response.json()
+            task_id = result.get("data", {}).get("task_id")
+            if not task_id:
+                return {"status": "error", "task_id": None, "output_path": None, "message": "No task ID returned from API"}
+
+            return {"status": "processing", "task_id": task_id, "output_path": None, "message": "Video generation started"}
+        except Exception as exc:
+            return {"status": "error", "task_id": None, "output_path": None, "message": f"{type(exc).__name__}: {exc}"}
+
+    async def generate_batch(self, items: List[Tuple[str, str]]) -> List[Dict[str, Optional[str]]]:
+        """並行送出多個 (image_path, prompt) 任務。
+
+        以 KLING_CONCURRENCY（預設 4）的 semaphore 限制同時在途請求數，
+        既吃滿配額又不觸發對方限流。
+        """
+        sem = asyncio.Semaphore(int(os.getenv("KLING_CONCURRENCY", "4") or "4"))
+
+        async def _one(image_path: str, prompt: str) -> Dict[str, Optional[str]]:
+            async with sem:
+                return await self.agenerate_video(image_path, prompt=prompt)
+
+        return list(await asyncio.gather(*(_one(path, prompt) for path, prompt in items)))
+
+    async def apoll_video_task(self, task_id: str) -> Dict[str, Optional[str]]:
+        """poll_video_task 的非同步版本；下載同樣以串流寫盤。"""
+        if not self.access_key or not self.secret_key:
+            return {"status": "error", "output_path": None, "message": "API keys not configured"}
+
+        client = self._get_async_client()
+        if client is None:
+            return {"status": "error", "output_path": None, "message": "httpx not available"}
+
+        try:
+            headers = self._get_headers()
+            api_url = f"{self.API_BASE_URL}/v1/videos/image2video/{task_id}"
+            response = await client.get(api_url, headers=headers, timeout=10)
+
+            if response.status_code != 200:
+                try:
+                    message = response.json().get("message", "Polling failed")
+                except Exception:
+                    message = f"HTTP {response.status_code}"
+                return {"status": "error", "output_path": None, "message": message}
+
+            data = response.json().get("data", {})
+            task_status = data.get("task_status")
+
+            if task_status in ("succeed", "success"):
+                videos = data.get("task_result", {}).get("videos", [])
+                video_url = videos[0].get("url") if videos else None
+                if not video_url:
+                    return {"status": "error", "output_path": None, "message": "No video URL in response"}
+
+                output_path, public_path = self._new_video_output()
+
+                async with client.stream("GET", video_url, timeout=120) as video_response:
+                    if video_response.status_code != 200:
+                        return {"status": "error", "output_path": None, "message": f"Failed to download video: HTTP {video_response.status_code}"}
+                    with open(output_path, 'wb') as f:
+                        async for chunk in video_response.aiter_bytes(64 * 1024):
+                            f.write(chunk)
+
+                return {"status": "completed", "output_path": public_path, "message": None}
+
+            if task_status in ("failed", "error"):
+                return {"status": "failed", "output_path": None, "message": data.get("task_status_msg") or "Video generation failed"}
+
+            if task_status in ("processing", "submitted", "pending"):
+                return {"status": "processing", "output_path": None, "message": "Video is being generated..."}
+
+            return {"status": "unknown", "output_path": None, "message": f"Unknown status: {task_status}"}
+        except Exception as e:
+            return {"status": "error", "output_path": None, "message": str(e)}
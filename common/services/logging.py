@@ -1,7 +1,43 @@
 import json
+import logging
+import logging.handlers
+import os
+import queue
 import sys
 from datetime import datetime
 
+try:
+    import orjson  # type: ignore  # C 實作 JSON，結構化日誌序列化快數倍
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+_queue_listener = None
+
+# 直接寫 fd 可繞過 TextIOWrapper 的逐次編碼與行緩衝 flush
+try:
+    _STDOUT_FD = sys.stdout.fileno()
+except Exception:  # pragma: no cover - 測試環境可能替換 stdout
+    _STDOUT_FD = None
+
+
+def setup_async_logging(level: int = logging.INFO) -> None:
+    """將 root logger 換成 QueueHandler，寫出由背景 QueueListener 處理。
+
+    請求執行緒只做 enqueue，不在回應路徑上同步寫 stdout；
+    於 app 啟動時呼叫一次即可，重複呼叫為 no-op。
+    """
+    global _queue_listener
+    if _queue_listener is not None:
+        return
+    log_queue: "queue.Queue" = queue.Queue(-1)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    _queue_listener = logging.handlers.QueueListener(log_queue, handler)
+    _queue_listener.start()
+
 
 def log_event(level: str, event: str, **fields) -> None:
     payload = {
@@ -11,7 +47,10 @@ def log_event(level: str, event: str, **fields) -> None:
     }
     payload.update(fields or {})
     try:
-        sys.stdout.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        if orjson is not None and _STDOUT_FD is not None:
+            os.write(_STDOUT_FD, orjson.dumps(payload, option=orjson.OPT_APPEND_NEWLINE))
+        else:
+            sys.stdout.write(json.dumps(payload, ensure_ascii=False) + "\n")
     except Exception:
         # best-effort logging
         pass
@@ -1,80 +1,125 @@
 from typing import Dict, Optional
 from uuid import uuid4
 from decimal import Decimal
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from ..db.session import get_session
 from ..models.cart_item import CartItem
 from ..models.order import Order
 from .logging import log_event
 
+# 與 model 上 index=True 的預設命名一致
+_UNIQUE_INDEX_DDL = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_order_external_payment_id "
+    'ON "order" (external_payment_id)'
+)
+
 
 class OrderService:
     """Order creation and retrieval backed by DB."""
 
     def __init__(self, session_factory=get_session):
         self._session_factory = session_factory
+        self._ensure_unique_index()
+
+    def _ensure_unique_index(self) -> None:
+        """補建 external_payment_id 的 unique 索引。
+
+        模型上的 unique=True 只在建新表時生效，既有部署的表不會被
+        create_all 改動、repo 也沒有 migration 機制；冪等寫入依賴這個
+        約束，啟動時 best-effort 建一次（已存在即 no-op）。
+        """
+        try:
+            with self._session_factory() as session:
+                session.execute(text(_UNIQUE_INDEX_DDL))
+        except Exception as e:
+            # 建立失敗（如既有重複資料）時照常啟動，僅記錄
+            log_event("warning", "order.unique_index_failed", error=str(e))
 
     def create_order(self, *, session_id: Optional[str], user_id: Optional[str], request_id: Optional[str] = None) -> Dict:
         """Create order from current cart (idempotency by request_id)."""
-        with self._session_factory() as session:
-            # idempotency: if request_id provided and existing order found, return it
-            if request_id:
+        # idempotency: if request_id provided and existing order found, return it.
+        # 用獨立的短 session 做唯讀查詢，重送的 webhook 不會開到寫入交易
+        if request_id:
+            with self._session_factory() as session:
+                # 只取需要的兩欄，免去反序列化 items JSON 大欄位
                 existing = (
-                    session.query(Order)
+                    session.query(Order.id, Order.status)
                     .filter(Order.external_payment_id == request_id)
                     .first()
                 )
                 if existing:
                     return {"order_id": existing.id, "status": existing.status}
-            q = session.query(CartItem)
-            if user_id:
-                q = q.filter(CartItem.user_id == user_id)
-            else:
-                q = q.filter(CartItem.session_id == session_id)
-            items = q.all()
-            subtotal = Decimal("0")
-            currency = "TWD"
-            snapshot = []
-            for it in items:
-                currency = it.currency or currency
-                line = Decimal(str(it.unit_price or 0)) * Decimal(it.quantity)
-                subtotal += line
-                snapshot.append(
-                    {
-                        "product_id": it.product_id,
-                        "variant": it.variant or {},
-                        "quantity": it.quantity,
-                        "unit_price": float(it.unit_price or 0),
-                        "currency": it.currency,
-                    }
+        try:
+            with self._session_factory() as session:
+                q = session.query(CartItem)
+                if user_id:
+                    q = q.filter(CartItem.user_id == user_id)
+                else:
+                    q = q.filter(CartItem.session_id == session_id)
+                items = q.all()
+                subtotal = Decimal("0")
+                currency = "TWD"
+                snapshot = []
+                for it in items:
+                    currency = it.currency or currency
+                    # Numeric 欄位本來就回傳 Decimal；只有其他型別才需轉換
+                    unit = it.unit_price if isinstance(it.unit_price, Decimal) else Decimal(str(it.unit_price or 0))
+                    subtotal += unit * it.quantity
+                    snapshot.append(
+                        {
+                            "product_id": it.product_id,
+                            "variant": it.variant or {},
+                            "quantity": it.quantity,
+                            "unit_price": float(unit),
+                            "currency": it.currency,
+                        }
+                    )
+                oid = str(uuid4())
+                order = Order(
+                    id=oid,
+                    session_id=session_id,
+                    user_id=user_id,
+                    items=snapshot,
+                    subtotal=subtotal,
+                    currency=currency,
+                    tax=Decimal("0"),
+                    total=subtotal,
+                    status="pending",
+                    payment_status="unpaid",
+                    external_payment_id=request_id,
                 )
-            oid = str(uuid4())
-            order = Order(
-                id=oid,
-                session_id=session_id,
-                user_id=user_id,
-                items=snapshot,
-                subtotal=subtotal,
-                currency=currency,
-                tax=Decimal("0"),
-                total=subtotal,
-                status="pending",
-                payment_status="unpaid",
-                external_payment_id=request_id,
-            )
-            session.add(order)
-            # Clear cart after order creation
-            for it in items:
-                session.delete(it)
-            # Ensure subsequent reads in same session observe changes
-            session.flush()
-            log_event("info", "order.created", order_id=oid, items=len(items), subtotal=float(subtotal))
-            return {"order_id": oid, "status": "pending"}
+                session.add(order)
+                # Clear cart after order creation（單一 DELETE，不逐列發語句）
+                q.delete(synchronize_session=False)
+                # Ensure subsequent reads in same session observe changes
+                session.flush()
+                log_event("info", "order.created", order_id=oid, items=len(items), subtotal=float(subtotal))
+                return {"order_id": oid, "status": "pending"}
+        except IntegrityError:
+            # 兩個相同 request_id 同時通過前置唯讀檢查時，unique 約束會擋下
+            # 後到者；重查並回傳先建立成功的那筆，維持冪等語意
+            if request_id:
+                with self._session_factory() as session:
+                    existing = (
+                        session.query(Order.id, Order.status)
+                        .filter(Order.external_payment_id == request_id)
+                        .first()
+                    )
+                    if existing:
+                        log_event("info", "order.dedup", order_id=existing.id)
+                        return {"order_id": existing.id, "status": existing.status}
+            raise
 
     def get_order(self, order_id: str) -> Dict:
         if not order_id:
             return {}
         with self._session_factory() as session:
-            o = session.query(Order).filter(Order.id == order_id).first()
+            o = (
+                session.query(Order.id, Order.status, Order.subtotal, Order.total)
+                .filter(Order.id == order_id)
+                .first()
+            )
             if not o:
                 return {}
             return {"order_id": o.id, "status": o.status, "subtotal": float(o.subtotal or 0), "total": float(o.total or 0)}
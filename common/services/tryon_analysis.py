@@ -3,98 +3,278 @@
 from __future__ import annotations
 
 import base64
+import functools
+import hashlib
 import json
+import logging
 import mimetypes
+import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import MappingProxyType
 from typing import Any, Dict, Optional
 
+try:
+    import orjson  # type: ignore  # C 實作 JSON，小型 unicode dict 解碼快數倍
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import pybase64 as _b64  # type: ignore  # SIMD base64，多 MB 圖片編碼快 5–10 倍
+except Exception:  # pragma: no cover
+    _b64 = base64  # type: ignore
+
+# orjson.loads 同時接受 str 與 bytes；兩種實作的解碼錯誤都是 ValueError 子類
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# 熱路徑用的 regex 於 import 時編譯一次，省去每次呼叫的 re._cache 查找
+logger = logging.getLogger(__name__)
+
+# 組好的 note 約 50 行；stdout 輸出成本遠高於組字串本身，預設關閉
+_DEBUG_COMPOSE = os.getenv("TRYON_DEBUG_COMPOSE", "").lower() in ("1", "true", "yes")
+
+# LLM 回應以 (prompt, 圖片內容) 為鍵快取：同一張服飾圖重複上傳時
+# 可整個跳過 base64 與網路來回（分析對同樣輸入是決定性的）
+_LLM_CACHE_MAX = 256
+_llm_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_llm_cache_lock = threading.Lock()
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_EXPLICIT_RE = re.compile(r"(內衣|泳裝|比基尼|lingerie|underwear|swim)", re.IGNORECASE)
+
+# 常見情況（LLM 乖乖回三選一）走單次 dict 查表，完全不碰 regex
+_EXPOSURE_MAP = {"low": "low", "medium": "medium", "high": "high"}
+
+_GARMENT_KEYS = ("garment_description", "on_body_description", "category", "explicit_terms")
+
+
+def _pluck(d: Dict[str, Any], keys: tuple) -> Dict[str, str]:
+    """一趟迴圈抽出多個字串欄位，None 一律正規化為空字串。"""
+    return {k: str(d.get(k, "") or "") for k in keys}
+
+
+# 固定提示詞 hoist 成模組常數：相鄰字面值在編譯期就摺疊完成，
+# 每次呼叫只剩一個 LOAD_GLOBAL，也方便單獨測試提示內容
+_GARMENT_PROMPT = (
+    "你是一位髮型設計專家，請分析提供的髮型照片，輸出 JSON 物件且不要出現額外文字。"
+    "必須包含下列鍵值："
+    "has_model (boolean)、exposure_level (\"low\"/\"medium\"/\"high\")、garment_description (string)、"
+    "on_body_description (string)、category (string)、explicit_terms (string)。"
+    "\n判斷準則："
+    "\n- has_model：若畫面中有真人或模特兒展示髮型，回傳 true。"
+    "\n- exposure_level：根據髮型風格判斷，前衛或特殊造型屬於 high，"
+    "流行時尚造型視為 medium，保守或傳統造型為 low。"
+    "\n- garment_description：用中文精確描述髮型的長度、顏色、質感、捲度、層次等特徵。"
+    "\n- on_body_description：描述這個髮型適合的臉型、場合，以及呈現的整體風格。"
+    "\n- category：簡短標示類別，例如長髮、短髮、捲髮、直髮、染髮等。"
+    "\n- explicit_terms：若偵測到特殊或需要注意的髮型特徵關鍵詞，請列出，否則給空字串。"
+)
+
+_USER_PROMPT = (
+    "你是一位造型顧問，請以 JSON 格式描述照片中的人物。"
+    "輸出必須只有 JSON，包含鍵：person_description (string)、pose (string)、lighting (string)、"
+    "style_tips (string)。"
+    "\n請描述人物的性別表現、臉型特徵、當前髮型、面部朝向、姿勢、燈光氛圍與可用於換髮型提示的重點。"
+)
+
+_PAIR_PROMPT = (
+    "你是一位髮型設計專家兼造型顧問。第一張圖片是髮型參考照，第二張圖片是使用者照片。"
+    "請輸出單一 JSON 物件且不要出現額外文字，格式為 {\"garment\": {...}, \"user\": {...}}。"
+    "\ngarment 物件必須包含："
+    "has_model (boolean)、exposure_level (\"low\"/\"medium\"/\"high\")、garment_description (string)、"
+    "on_body_description (string)、category (string)、explicit_terms (string)。"
+    "\n判斷準則："
+    "\n- has_model：若畫面中有真人或模特兒展示髮型，回傳 true。"
+    "\n- exposure_level：根據髮型風格判斷，前衛或特殊造型屬於 high，"
+    "流行時尚造型視為 medium，保守或傳統造型為 low。"
+    "\n- garment_description：用中文精確描述髮型的長度、顏色、質感、捲度、層次等特徵。"
+    "\n- on_body_description：描述這個髮型適合的臉型、場合，以及呈現的整體風格。"
+    "\n- category：簡短標示類別，例如長髮、短髮、捲髮、直髮、染髮等。"
+    "\n- explicit_terms：若偵測到特殊或需要注意的髮型特徵關鍵詞，請列出，否則給空字串。"
+    "\nuser 物件必須包含：person_description (string)、pose (string)、lighting (string)、"
+    "style_tips (string)。"
+    "\n請描述人物的性別表現、臉型特徵、當前髮型、面部朝向、姿勢、燈光氛圍與可用於換髮型提示的重點。"
+)
+
+# parts 的 text 區塊也固定不變，包成 dict 一次建好重複使用
+_GARMENT_TEXT_PART = {"text": _GARMENT_PROMPT}
+_USER_TEXT_PART = {"text": _USER_PROMPT}
+_PAIR_TEXT_PART = {"text": _PAIR_PROMPT}
+
+# 預設回傳值用唯讀模板 + dict() 淺拷貝，省去每次 BUILD_MAP 的字面值重建
+_GARMENT_DEFAULT = MappingProxyType(
+    {
+        "has_model": "unknown",
+        "exposure_level": "medium",
+        "garment_description": "",
+        "on_body_description": "",
+        "category": "",
+        "explicit_terms": "",
+        "raw": "",
+    }
+)
+
+_USER_DEFAULT = MappingProxyType({"summary": "", "details": "", "raw": ""})
+
+
+@functools.lru_cache(maxsize=32)
+def _guess_mime(suffix: str) -> str:
+    """以副檔名快取 MIME 判斷；mimetypes 內部的 init/查表毋須每次重跑。"""
+    return mimetypes.guess_type("x" + suffix)[0] or "image/jpeg"
+
+
+# compose_note 的固定規則區塊；每次換裝都會用到，故 hoist 成模組常數
+_STATIC_RULES = (
+    "",
+    "🚫 ABSOLUTE PROHIBITION - CLOTHING CHANGES ARE FORBIDDEN:",
+    "- DO NOT change, modify, replace, or alter ANY clothing items from the user's photo",
+    "- DO NOT copy clothing from the hairstyle reference image",
+    "- Treat the user's clothing as READ-ONLY - it cannot be modified",
+    "- If the user wears a shirt → keep the EXACT same shirt",
+    "- If the user wears a dress → keep the EXACT same dress",
+    "- If the user wears pants → keep the EXACT same pants",
+    "- If the user wears a jacket → keep the EXACT same jacket",
+    "- Changing clothing is a VIOLATION and is UNACCEPTABLE",
+    "",
+    "⚠️ MANDATORY REQUIREMENTS (FOLLOW EXACTLY):",
+    "- Replace ONLY the user's hairstyle (the hair on the head)",
+    "- NOTHING BELOW THE NECK should change",
+    "- Keep the user's facial features, face shape, skin tone, and facial expression EXACTLY the same",
+    "- Keep the user's neck, body pose, position, and proportions EXACTLY the same",
+    "- Keep the user's clothing EXACTLY the same - DO NOT change, replace, or modify ANY clothing items",
+    "- Keep ALL accessories EXACTLY the same (jewelry, glasses, watches, bags, belts, shoes, etc.)",
+    "- Keep the background, environment, scene, and all objects EXACTLY the same",
+    "- Keep the lighting, shadows, and camera angle EXACTLY the same",
+    "- The ONLY visible difference should be the hairstyle on the head - NOTHING ELSE may change",
+    "",
+    "⚠️ SPECIAL WARNING FOR FULL-BODY PHOTOS:",
+    "- Even if the user's photo shows the full body with visible clothing, DO NOT change ANY clothing",
+    "- The entire body from neck down must remain PIXEL-PERFECT IDENTICAL",
+    "- All clothing items must be preserved exactly as they appear in the user's photo",
+    "- If you see a shirt in the user's photo → the output MUST have the EXACT SAME shirt",
+    "- If you see pants in the user's photo → the output MUST have the EXACT SAME pants",
+    "- If you see a dress in the user's photo → the output MUST have the EXACT SAME dress",
+    "- Clothing visibility does NOT give you permission to modify it",
+)
+
+_HIGH_EXPOSURE_LINES = (
+    "Present the hairstyle as a professional hair salon portfolio demonstration—keep it tasteful, artistic, and suitable for commercial use.",
+    "Focus on showcasing the hairstyle design and technique; maintain professional salon photography standards.",
+    "Use professional studio lighting style consistent with high-end hair salon portfolios.",
+)
+
+_LOW_EXPOSURE_LINE = (
+    "Maintain fidelity to the hairstyle's design while keeping the result natural and professional for a hair salon catalog."
+)
+
+
+def _find_json_object(text: str) -> Optional[str]:
+    """線性掃描找出第一個平衡的 JSON 物件；不走 regex 回溯。
+
+    追蹤大括號深度並跳過字串字面值（含跳脫字元），
+    對夾雜說明文字的 LLM 回應比 greedy regex 便宜且正確。
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_str = False
+    esc = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif c == "\\":
+                esc = True
+            elif c == '"':
+                in_str = False
+            continue
+        if c == '"':
+            in_str = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
 
 class TryOnAnalysisService:
     """封裝 Gemini LLM 描述流程，建立統一的換衣提示。"""
 
     def __init__(self, tryon_service: Any) -> None:
         self._svc = tryon_service
+        # 建構時就解析出 Gemini 服務物件（支援兩種注入方式），
+        # 之後每次呼叫只需讀 client 屬性本身——client 可能因設定
+        # 熱重載而重建，故不在此快取
+        self._gemini = getattr(tryon_service, "gemini", None) or tryon_service
 
     # ------------------------------------------------------------------
     # Public helpers
 
     def analyze_garment(self, image_path: Path) -> Dict[str, Any]:
-        default = {
-            "has_model": "unknown",
-            "exposure_level": "medium",
-            "garment_description": "",
-            "on_body_description": "",
-            "category": "",
-            "explicit_terms": "",
-            "raw": "",
-        }
+        default = dict(_GARMENT_DEFAULT)
         if not image_path or not image_path.exists():
-            print(f"[TryOnAnalysis] garment image not found: {image_path}")
+            logger.warning("garment image not found: %s", image_path)
             return default
 
-        prompt = (
-            "你是一位髮型設計專家，請分析提供的髮型照片，輸出 JSON 物件且不要出現額外文字。"
-            "必須包含下列鍵值："
-            "has_model (boolean)、exposure_level (\"low\"/\"medium\"/\"high\")、garment_description (string)、"
-            "on_body_description (string)、category (string)、explicit_terms (string)。"
-            "\n判斷準則："
-            "\n- has_model：若畫面中有真人或模特兒展示髮型，回傳 true。"
-            "\n- exposure_level：根據髮型風格判斷，前衛或特殊造型屬於 high，"
-            "流行時尚造型視為 medium，保守或傳統造型為 low。"
-            "\n- garment_description：用中文精確描述髮型的長度、顏色、質感、捲度、層次等特徵。"
-            "\n- on_body_description：描述這個髮型適合的臉型、場合，以及呈現的整體風格。"
-            "\n- category：簡短標示類別，例如長髮、短髮、捲髮、直髮、染髮等。"
-            "\n- explicit_terms：若偵測到特殊或需要注意的髮型特徵關鍵詞，請列出，否則給空字串。"
-        )
-
-        response = self._call_llm(prompt, image_path)
+        response = self._call_llm(_GARMENT_TEXT_PART, image_path)
         default["raw"] = response
         parsed = self._parse_json_response(response)
         if not parsed:
-            print("[TryOnAnalysis] Garment description JSON decode failed; fallback to defaults")
+            logger.warning("Garment description JSON decode failed; fallback to defaults")
             return default
-
-        info = {
-            "has_model": bool(parsed.get("has_model")),
-            "exposure_level": self._normalize_exposure(str(parsed.get("exposure_level", "medium"))),
-            "garment_description": str(parsed.get("garment_description", "")),
-            "on_body_description": str(parsed.get("on_body_description", "")),
-            "category": str(parsed.get("category", "")),
-            "explicit_terms": str(parsed.get("explicit_terms", "")),
-            "raw": response,
-        }
-        if info["explicit_terms"]:
-            info["exposure_level"] = "high"
-        return info
+        return self._garment_info_from(parsed, response)
 
     def analyze_user(self, image_path: Path) -> Dict[str, str]:
-        default = {"summary": "", "details": "", "raw": ""}
         if not image_path or not image_path.exists():
-            print(f"[TryOnAnalysis] user image not found: {image_path}")
-            return default
-
-        prompt = (
-            "你是一位造型顧問，請以 JSON 格式描述照片中的人物。"
-            "輸出必須只有 JSON，包含鍵：person_description (string)、pose (string)、lighting (string)、"
-            "style_tips (string)。"
-            "\n請描述人物的性別表現、臉型特徵、當前髮型、面部朝向、姿勢、燈光氛圍與可用於換髮型提示的重點。"
-        )
+            logger.warning("user image not found: %s", image_path)
+            return dict(_USER_DEFAULT)
 
-        response = self._call_llm(prompt, image_path)
-        default["raw"] = response
+        response = self._call_llm(_USER_TEXT_PART, image_path)
         parsed = self._parse_json_response(response)
         if not parsed:
-            print("[TryOnAnalysis] User description JSON decode failed; fallback到預設")
-            return default
-
-        summary_parts = [str(parsed.get("person_description", "")).strip()]
-        pose = str(parsed.get("pose", "")).strip()
-        lighting = str(parsed.get("lighting", "")).strip()
-        tips = str(parsed.get("style_tips", "")).strip()
-        default["summary"] = "；".join([p for p in summary_parts if p])
-        default["details"] = "；".join([p for p in (pose, lighting, tips) if p])
-        return default
+            logger.warning("User description JSON decode failed; fallback到預設")
+            return {"summary": "", "details": "", "raw": response}
+        return self._user_info_from(parsed, response)
+
+    def analyze_pair(self, garment_path: Path, user_path: Path) -> tuple:
+        """單次多模態呼叫同時分析髮型圖與使用者照，省掉一趟 LLM 往返。
+
+        回傳 (garment_info, user_info)；任何一張圖缺漏或合併回應
+        無法解析時，退回逐張分析確保結果形狀不變。
+        """
+        if (
+            not garment_path
+            or not garment_path.exists()
+            or not user_path
+            or not user_path.exists()
+        ):
+            return self.analyze_garment(garment_path), self.analyze_user(user_path)
+
+        response = self._call_llm_images(_PAIR_TEXT_PART, (garment_path, user_path))
+        parsed = self._parse_json_response(response)
+        garment_raw = parsed.get("garment") if parsed else None
+        user_raw = parsed.get("user") if parsed else None
+        if not isinstance(garment_raw, dict) or not isinstance(user_raw, dict):
+            logger.warning("Pair analysis JSON decode failed; fallback to separate calls")
+            return self.analyze_garment(garment_path), self.analyze_user(user_path)
+        return self._garment_info_from(garment_raw, response), self._user_info_from(user_raw, response)
+
+    def analyze_both(self, garment_path: Path, user_path: Path) -> tuple:
+        """平行執行兩次獨立分析；LLM 呼叫在 HTTP 等待時釋放 GIL，
+
+        總耗時收斂為較慢的一次而非兩次相加。回傳 (garment_info, user_info)。
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            garment_future = executor.submit(self.analyze_garment, garment_path)
+            user_future = executor.submit(self.analyze_user, user_path)
+            return garment_future.result(), user_future.result()
 
     def compose_note(
         self,
@@ -125,51 +305,12 @@ class TryOnAnalysisService:
                 "CRITICAL: Extract ONLY the hairstyle characteristics from the reference image. DO NOT copy the reference person's face, body, pose, or clothing. Apply the hairstyle to the user's appearance."
             )
 
-        lines.extend([
-            "",
-            "🚫 ABSOLUTE PROHIBITION - CLOTHING CHANGES ARE FORBIDDEN:",
-            "- DO NOT change, modify, replace, or alter ANY clothing items from the user's photo",
-            "- DO NOT copy clothing from the hairstyle reference image",
-            "- Treat the user's clothing as READ-ONLY - it cannot be modified",
-            "- If the user wears a shirt → keep the EXACT same shirt",
-            "- If the user wears a dress → keep the EXACT same dress",
-            "- If the user wears pants → keep the EXACT same pants",
-            "- If the user wears a jacket → keep the EXACT same jacket",
-            "- Changing clothing is a VIOLATION and is UNACCEPTABLE",
-            "",
-            "⚠️ MANDATORY REQUIREMENTS (FOLLOW EXACTLY):",
-            "- Replace ONLY the user's hairstyle (the hair on the head)",
-            "- NOTHING BELOW THE NECK should change",
-            "- Keep the user's facial features, face shape, skin tone, and facial expression EXACTLY the same",
-            "- Keep the user's neck, body pose, position, and proportions EXACTLY the same", 
-            "- Keep the user's clothing EXACTLY the same - DO NOT change, replace, or modify ANY clothing items",
-            "- Keep ALL accessories EXACTLY the same (jewelry, glasses, watches, bags, belts, shoes, etc.)",
-            "- Keep the background, environment, scene, and all objects EXACTLY the same",
-            "- Keep the lighting, shadows, and camera angle EXACTLY the same",
-            "- The ONLY visible difference should be the hairstyle on the head - NOTHING ELSE may change",
-            "",
-            "⚠️ SPECIAL WARNING FOR FULL-BODY PHOTOS:",
-            "- Even if the user's photo shows the full body with visible clothing, DO NOT change ANY clothing",
-            "- The entire body from neck down must remain PIXEL-PERFECT IDENTICAL",
-            "- All clothing items must be preserved exactly as they appear in the user's photo",
-            "- If you see a shirt in the user's photo → the output MUST have the EXACT SAME shirt",
-            "- If you see pants in the user's photo → the output MUST have the EXACT SAME pants",
-            "- If you see a dress in the user's photo → the output MUST have the EXACT SAME dress",
-            "- Clothing visibility does NOT give you permission to modify it"
-        ])
+        lines.extend(_STATIC_RULES)
 
         if exposure == "high":
-            lines.extend(
-                [
-                    "Present the hairstyle as a professional hair salon portfolio demonstration—keep it tasteful, artistic, and suitable for commercial use.",
-                    "Focus on showcasing the hairstyle design and technique; maintain professional salon photography standards.",
-                    "Use professional studio lighting style consistent with high-end hair salon portfolios.",
-                ]
-            )
+            lines.extend(_HIGH_EXPOSURE_LINES)
         else:
-            lines.append(
-                "Maintain fidelity to the hairstyle's design while keeping the result natural and professional for a hair salon catalog."
-            )
+            lines.append(_LOW_EXPOSURE_LINE)
 
         user_summary = user_info.get("summary", "").strip()
         user_details = user_info.get("details", "").strip()
@@ -182,72 +323,121 @@ class TryOnAnalysisService:
             lines.append(f"User additional note: {user_note}")
 
         composed = "\n".join(lines)
-        print(f"[TryOnAnalysis] Composed try-on note:\n{composed}")
+        if _DEBUG_COMPOSE:
+            logger.debug("Composed try-on note:\n%s", composed)
         return composed
 
     # ------------------------------------------------------------------
     # Internal helpers
 
-    def _call_llm(self, prompt: str, image_path: Path) -> str:
-        # 支持两种调用方式：
-        # 1. 从 TryOnService.gemini 获取（旧方式）
-        # 2. 直接从 GeminiService 获取（新方式）
-        gemini = getattr(self._svc, "gemini", None) or self._svc
+    def _call_llm(self, text_part: Dict[str, str], image_path: Path) -> str:
+        return self._call_llm_images(text_part, (image_path,))
+
+    def _call_llm_images(self, text_part: Dict[str, str], image_paths: tuple) -> str:
+        prompt = text_part["text"]
+        gemini = self._gemini
         client = getattr(gemini, "client", None) if gemini else None
         if not client:
-            print("[TryOnAnalysis] Gemini LLM 未啟用，跳過描述流程。")
-            return ""
-
-        mime_type = mimetypes.guess_type(image_path.name)[0] or "image/jpeg"
-        try:
-            image_bytes = image_path.read_bytes()
-        except OSError as exc:
-            print(f"[TryOnAnalysis] 讀取圖片失敗 {image_path}: {exc}")
+            logger.info("Gemini LLM 未啟用，跳過描述流程。")
             return ""
 
-        parts = [
-            {"text": prompt},
-            {
-                "inline_data": {
-                    "mime_type": mime_type,
-                    "data": base64.b64encode(image_bytes).decode("utf-8"),
+        key_parts = [hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).digest()]
+        images = []
+        for image_path in image_paths:
+            try:
+                image_bytes = image_path.read_bytes()
+            except OSError as exc:
+                logger.warning("讀取圖片失敗 %s: %s", image_path, exc)
+                return ""
+            key_parts.append(hashlib.blake2b(image_bytes, digest_size=16).digest())
+            images.append((_guess_mime(image_path.suffix.lower()), image_bytes))
+
+        cache_key = tuple(key_parts)
+        with _llm_cache_lock:
+            cached = _llm_cache.get(cache_key)
+            if cached is not None:
+                _llm_cache.move_to_end(cache_key)
+                logger.debug("LLM cache hit for %s", ", ".join(p.name for p in image_paths))
+                return cached
+
+        parts = [text_part]
+        for mime_type, image_bytes in images:
+            # 編碼後立即釋放原始 bytes；b64 輸出必為 ASCII
+            parts.append(
+                {
+                    "inline_data": {
+                        "mime_type": mime_type,
+                        "data": _b64.b64encode(image_bytes).decode("ascii"),
+                    }
                 }
-            },
-        ]
+            )
+        del images
 
-        print(f"[TryOnAnalysis] LLM prompt:\n{prompt}")
+        logger.debug("LLM prompt:\n%s", prompt)
 
         try:
             llm_model = getattr(gemini, "llm_model_name", None) or getattr(gemini, "llm_name", "gemini-2.5-flash")
-            print(f"[TryOnAnalysis] Calling LLM with model={llm_model}, client={type(client).__name__}")
+            logger.debug("Calling LLM with model=%s, client=%s", llm_model, type(client).__name__)
             response = client.models.generate_content(
                 model=llm_model,
                 contents={"parts": parts},
             )
-            print(f"[TryOnAnalysis] LLM response received, type={type(response).__name__}")
+            logger.debug("LLM response received, type=%s", type(response).__name__)
         except Exception as exc:
-            print(f"[TryOnAnalysis] LLM 呼叫失敗: {type(exc).__name__}: {exc}")
-            import traceback
-            traceback.print_exc()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.exception("LLM 呼叫失敗")
+            else:
+                logger.warning("LLM 呼叫失敗: %s: %s", type(exc).__name__, exc)
             return ""
 
         text = self._strip_markdown_fences(self._extract_text(response))
-        print(f"[TryOnAnalysis] LLM response:\n{text}")
+        logger.debug("LLM response:\n%s", text)
+        if text:
+            with _llm_cache_lock:
+                _llm_cache[cache_key] = text
+                if len(_llm_cache) > _LLM_CACHE_MAX:
+                    _llm_cache.popitem(last=False)
         return text
 
+    def _garment_info_from(self, parsed: Dict[str, Any], raw: str) -> Dict[str, Any]:
+        info = {
+            **_pluck(parsed, _GARMENT_KEYS),
+            "has_model": bool(parsed.get("has_model")),
+            "exposure_level": self._normalize_exposure(str(parsed.get("exposure_level", "medium"))),
+            "raw": raw,
+        }
+        if info["explicit_terms"]:
+            info["exposure_level"] = "high"
+        return info
+
+    @staticmethod
+    def _user_info_from(parsed: Dict[str, Any], raw: str) -> Dict[str, str]:
+        # 一趟 generator 完成取值、strip 與過濾空字串，不留中間變數
+        details = "；".join(
+            v for v in (str(parsed.get(k, "")).strip() for k in ("pose", "lighting", "style_tips")) if v
+        )
+        return {
+            "summary": str(parsed.get("person_description", "")).strip(),
+            "details": details,
+            "raw": raw,
+        }
+
     @staticmethod
     def _extract_text(response: Any) -> str:
         if response is None:
             return ""
-        if hasattr(response, "text") and response.text:
-            return str(response.text)
-        if hasattr(response, "candidates") and response.candidates:
-            candidate = response.candidates[0]
-            if hasattr(candidate, "content") and getattr(candidate.content, "parts", None):
-                texts = [getattr(part, "text", "") for part in candidate.content.parts]
-                return "".join(t for t in texts if t)
-        if hasattr(response, "result") and isinstance(response.result, str):
-            return response.result
+        # getattr 含預設值比 hasattr+屬性存取少一次查找，也不吞例外
+        text = getattr(response, "text", None)
+        if text:
+            return str(text)
+        candidates = getattr(response, "candidates", None)
+        if candidates:
+            parts = getattr(getattr(candidates[0], "content", None), "parts", None)
+            if parts:
+                return "".join(t for t in (getattr(p, "text", "") for p in parts) if t)
+        result = getattr(response, "result", None)
+        if isinstance(result, str):
+            return result
         return ""
 
     @staticmethod
@@ -255,32 +445,35 @@ class TryOnAnalysisService:
         if not text:
             return ""
         cleaned = text.strip()
-        fence_match = re.match(r"```(?:json)?\s*(.*?)\s*```", cleaned, re.DOTALL | re.IGNORECASE)
+        # 多數回應是乾淨 JSON：首字元是 { 就不可能帶 fence，直接跳過 regex
+        if cleaned.startswith("{"):
+            return cleaned
+        fence_match = _FENCE_RE.match(cleaned)
         if fence_match:
             return fence_match.group(1).strip()
         return cleaned
 
-    def _parse_json_response(self, text: str) -> Optional[Dict[str, Any]]:
-        if not text:
+    def _parse_json_response(self, stripped: str) -> Optional[Dict[str, Any]]:
+        """解析已經去除 markdown fence 的回應（_call_llm 輸出即為此形式）。"""
+        if not stripped:
             return None
-        stripped = self._strip_markdown_fences(text)
         try:
-            return json.loads(stripped)
-        except json.JSONDecodeError:
-            match = re.search(r"\{.*\}", stripped, re.DOTALL)
-            if match:
+            return _json_loads(stripped)
+        except ValueError:
+            candidate = _find_json_object(stripped)
+            if candidate:
                 try:
-                    return json.loads(match.group(0))
-                except json.JSONDecodeError:
+                    return _json_loads(candidate)
+                except ValueError:
                     return None
         return None
 
     @staticmethod
     def _normalize_exposure(value: str) -> str:
-        normalized = value.strip().lower()
-        if normalized in {"low", "medium", "high"}:
-            return normalized
-        if re.search(r"(內衣|泳裝|比基尼|lingerie|underwear|swim)", value, re.IGNORECASE):
+        hit = _EXPOSURE_MAP.get(value.strip().lower())
+        if hit:
+            return hit
+        if _EXPLICIT_RE.search(value):
             return "high"
         return "medium"
 
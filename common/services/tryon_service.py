@@ -1,7 +1,12 @@
+import functools
+import json
+import logging
+import mmap
 import os
+import secrets
 import shutil
-import time
 import base64
+from collections import OrderedDict
 from io import BytesIO
 import threading
 try:
@@ -9,7 +14,6 @@ try:
 except Exception:
     Image = None  # type: ignore
 
-HEIF_SUPPORTED = False
 HEIF_MIME_TYPES = {
     "image/heic",
     "image/heif",
@@ -17,19 +21,38 @@ HEIF_MIME_TYPES = {
     "image/heif-sequence",
 }
 
-try:
-    from pillow_heif import register_heif_opener  # type: ignore
 
-    register_heif_opener()
-    HEIF_SUPPORTED = True
-except Exception:
-    HEIF_SUPPORTED = False
+@functools.lru_cache(maxsize=None)
+def _ensure_heif() -> bool:
+    """第一次遇到 HEIC 才載入並註冊 pillow_heif；回傳是否可用。
+
+    pillow_heif 連 libheif 一起載入不便宜，大多數上傳是 JPG/PNG，
+    延後到真的需要時才付這筆成本。
+    """
+    try:
+        import pillow_heif  # type: ignore
+
+        pillow_heif.register_heif_opener()
+        # libheif 支援多執行緒解碼；HEIC 只在 ingest 解一次，開滿核心數
+        # （舊版 pillow_heif 沒有這個選項，hasattr 檢查避免只是掛上新屬性）
+        if hasattr(pillow_heif.options, "DECODE_THREADS"):
+            pillow_heif.options.DECODE_THREADS = os.cpu_count() or 1
+        return True
+    except Exception:
+        return False
+
+
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, Optional, Union
 
 from common.services.tryon_analysis import TryOnAnalysisService
 from urllib.parse import urlparse
 
+# print 會搶 stdout 鎖且每次都格式化；logger 以 % 參數延遲格式化，
+# 層級關閉時幾乎零成本（verbose 行降為 DEBUG）
+log = logging.getLogger("tryon")
+
 try:
     # 使用整合後的新位置（優先）
     from common.services.gemini_service import GeminiService  # type: ignore
@@ -37,21 +60,16 @@ except Exception as _e1:  # pragma: no cover - 匯入失敗時改用次要位置
     try:
         # 後備：web_app 版本（避免環境路徑問題）
         from web_app.app.services.gemini_service import GeminiService  # type: ignore
-        print("[TryOn] fallback: using web_app.app.services.gemini_service.GeminiService")
+        log.warning("fallback: using web_app.app.services.gemini_service.GeminiService")
     except Exception as _e2:
-        print(f"[TryOn] failed to import GeminiService: primary={type(_e1).__name__}, fallback={type(_e2).__name__}")
+        log.warning("failed to import GeminiService: primary=%s, fallback=%s", type(_e1).__name__, type(_e2).__name__)
         GeminiService = None  # type: ignore
 
 try:
     from common.services.klingai_service import KlingAIService  # type: ignore
 except Exception as _e3:
-    print(f"[TryOn] failed to import KlingAIService: {type(_e3).__name__}")
+    log.warning("failed to import KlingAIService: %s", type(_e3).__name__)
     KlingAIService = None  # type: ignore
-try:
-    from dotenv import load_dotenv  # type: ignore
-except Exception:
-    load_dotenv = None  # type: ignore
-
 try:
     from common.db.session import get_session
     from common.models.tryon_record import TryOnRecord
@@ -59,6 +77,19 @@ except Exception:
     get_session = None  # type: ignore
     TryOnRecord = None  # type: ignore
 
+# _to_web_url 熱路徑用：sentinel 與分隔符判斷在 import 時算一次
+_STATIC_SEP = os.path.sep + "static" + os.path.sep
+_SEP_IS_SLASH = os.path.sep == "/"
+
+
+class _DirRef:
+    """共享輸出目錄參照：換目錄只改 .path，拿著同一個 ref 的服務即時讀到新值。"""
+
+    __slots__ = ("path",)
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
 
 class TryOnService:
     """Minimal try-on service (mock): copies user image as output.
@@ -70,41 +101,52 @@ class TryOnService:
                  settings_json_path: Optional[str] = None) -> None:
         
         self.base_dir = Path(base_dir or Path.cwd())
+
+        # 已確認存在的目錄集合：mkdir(parents=True, exist_ok=True) 只付一次 syscall
+        self._known_dirs: set = set()
         
         # Determine paths based on the app context (web or live-demo)
         path_map = app_path_map or {}
         self._inputs_dir = Path(path_map.get("inputs") or self.base_dir / "app" / "static" / "inputs")
-        self._outputs_dir = Path(path_map.get("outputs") or self.base_dir / "app" / "static" / "outputs")
+        # 輸出目錄用共享參照傳給 vendor services；setter 改 ref 即全面生效
+        self._outputs_dir_ref = _DirRef(Path(path_map.get("outputs") or self.base_dir / "app" / "static" / "outputs"))
         self._garments_dir = Path(path_map.get("garments") or self.base_dir / "app" / "static" / "garments")
         
-        self._inputs_dir.mkdir(parents=True, exist_ok=True)
-        self._outputs_dir.mkdir(parents=True, exist_ok=True)
-        self._garments_dir.mkdir(parents=True, exist_ok=True)
+        self._ensure_dir(self._inputs_dir)
+        self._ensure_dir(self._outputs_dir)
+        self._ensure_dir(self._garments_dir)
 
         # Legacy paths for backward compatibility if needed, though direct path injection is better
         self.legacy_outputs_dir = self.base_dir / "app" / "static" / "outputs"
         self.legacy_inputs_dir = self.base_dir / "app" / "static" / "inputs"
-        self.legacy_outputs_dir.mkdir(parents=True, exist_ok=True)
-        self.legacy_inputs_dir.mkdir(parents=True, exist_ok=True)
+        self._ensure_dir(self.legacy_outputs_dir)
+        self._ensure_dir(self.legacy_inputs_dir)
         
         try:
-            if load_dotenv:
-                load_dotenv(self.base_dir / ".env")
+            # dotenv 只在啟動時用一次，延後到這裡才 import
+            from dotenv import load_dotenv  # type: ignore
+
+            load_dotenv(self.base_dir / ".env")
         except Exception:
             pass
         
+        # _to_web_url 快路徑：輸出目錄的上層（…/static）前綴預先算好
+        self._static_prefix = str(self._outputs_dir.parent)
+
         # Load vendor selection from settings
         self._settings_json_path = settings_json_path
+        # mtime 快取：settings 沒變時不重讀、不重新解析 JSON
+        self._vendor_cache: Optional[tuple] = None  # (path, mtime_ns, vendor)
         self._vendor = self._load_vendor_setting()
         
         # Initialize both services
         self.gemini = GeminiService(
-            outputs_dir=str(self._outputs_dir),
+            outputs_dir=self._outputs_dir_ref,
             settings_json_path=settings_json_path
         ) if GeminiService else None
-        
+
         self.klingai = KlingAIService(
-            outputs_dir=str(self._outputs_dir),
+            outputs_dir=self._outputs_dir_ref,
             settings_json_path=settings_json_path
         ) if KlingAIService else None
         
@@ -113,44 +155,63 @@ class TryOnService:
             client = getattr(self.gemini, "client", None) if self.gemini else None
             client_on = client is not None
             client_type = type(client).__name__ if client else "None"
-            print(f"[TryOn] gemini available={bool(self.gemini)} api_key={'set' if api_set else 'missing'} client={'on' if client_on else 'off'} client_type={client_type}")
+            log.info("gemini available=%s api_key=%s client=%s client_type=%s", bool(self.gemini), "set" if api_set else "missing", "on" if client_on else "off", client_type)
         except Exception as e:
-            print(f"[TryOn] Error checking gemini status: {e}")
+            log.warning("Error checking gemini status: %s", e)
         
         try:
             klingai_access_set = bool(getattr(self.klingai, "access_key", None)) if self.klingai else False
             klingai_secret_set = bool(getattr(self.klingai, "secret_key", None)) if self.klingai else False
-            print(f"[TryOn] klingai available={bool(self.klingai)} access_key={'set' if klingai_access_set else 'missing'} secret_key={'set' if klingai_secret_set else 'missing'}")
+            log.info("klingai available=%s access_key=%s secret_key=%s", bool(self.klingai), "set" if klingai_access_set else "missing", "set" if klingai_secret_set else "missing")
         except Exception as e:
-            print(f"[TryOn] Error checking klingai status: {e}")
+            log.warning("Error checking klingai status: %s", e)
         
-        print(f"[TryOn] Selected vendor: {self._vendor}")
+        log.info("Selected vendor: %s", self._vendor)
         
-        self._session_outputs: dict[str, str] = {}
-        self._session_errors: dict[str, str] = {}
-        import threading
-        self._lock = threading.Lock()
+        # 熱門服飾圖以 mmap 共用 kernel 頁面：同一張圖的後續 session
+        # 不再重讀磁碟、也不各自複製一份到 userspace
+        self._garment_mmap_cache: "OrderedDict[str, mmap.mmap]" = OrderedDict()
+        self._garment_mmap_lock = threading.Lock()
+
+        # 每個 session 一個 Future：輪詢端以 done()/result() 免鎖讀取，
+        # 鎖只保護 dict 本身的插入，不再跨所有 session 競爭
+        self._sessions: dict[str, Future] = {}
+        self._sessions_lock = threading.Lock()
+
+        # 共用背景工作池：重用 OS 執行緒、以環境變數管控併發上限，
+        # 取代每個請求各開一條 daemon thread（負載高時無上限）
+        self._bg_pool = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("TRYON_BG_WORKERS", "8")),
+            thread_name_prefix="tryon-bg",
+        )
+        # 小型 I/O 池：garment staging 與使用者圖解碼可並行。
+        # 與 _bg_pool 分開，避免工作互相等待時把同一個池塞死
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tryon-io")
         # Note: _analysis is kept for compatibility but not used in SIMPLE mode
         # SIMPLE mode uses pure visual extraction (no text descriptions needed)
         self._analysis = TryOnAnalysisService(self)
 
+    @property
+    def _outputs_dir(self) -> Path:
+        # 舊程式碼（含 provider）直接讀寫 _outputs_dir，保留介面、轉到共享 ref
+        return self._outputs_dir_ref.path
+
+    @_outputs_dir.setter
+    def _outputs_dir(self, value: Union[str, Path]) -> None:
+        self._outputs_dir_ref.path = Path(value)
+
     @property
     def outputs_dir(self) -> Path:
         """Get the current outputs directory."""
-        return self._outputs_dir
-    
+        return self._outputs_dir_ref.path
+
     @outputs_dir.setter
     def outputs_dir(self, value: Union[str, Path]) -> None:
-        """Set the outputs directory and update dependent services."""
-        self._outputs_dir = Path(value)
-        self._outputs_dir.mkdir(parents=True, exist_ok=True)
-        # Update gemini service if it exists
-        if self.gemini and hasattr(self.gemini, 'outputs_dir'):
-            self.gemini.outputs_dir = self._outputs_dir
-        # Update klingai service if it exists
-        if self.klingai and hasattr(self.klingai, 'outputs_dir'):
-            self.klingai.outputs_dir = self._outputs_dir
-    
+        """Set the outputs directory; vendor services 透過共享 ref 直接看到新值。"""
+        self._outputs_dir_ref.path = Path(value)
+        self._ensure_dir(self._outputs_dir_ref.path)
+        self._static_prefix = str(self._outputs_dir_ref.path.parent)
+
     @property
     def inputs_dir(self) -> Path:
         """Get the current inputs directory."""
@@ -160,26 +221,31 @@ class TryOnService:
     def inputs_dir(self, value: Union[str, Path]) -> None:
         """Set the inputs directory."""
         self._inputs_dir = Path(value)
-        self._inputs_dir.mkdir(parents=True, exist_ok=True)
+        self._ensure_dir(self._inputs_dir)
 
     def _load_vendor_setting(self) -> str:
-        """Load VENDOR_TRYON setting from settings.json"""
+        """Load VENDOR_TRYON setting from settings.json（mtime 快取，熱路徑免重解析）"""
         try:
-            if self._settings_json_path and Path(self._settings_json_path).exists():
-                import json
-                settings = json.loads(Path(self._settings_json_path).read_text(encoding="utf-8"))
-                vendor = settings.get("VENDOR_TRYON", "Gemini")
-                return vendor
-            else:
-                # Fallback to default settings path
+            # 解析出實際生效的 settings 路徑（指定路徑優先，否則退回預設）
+            path = Path(self._settings_json_path) if self._settings_json_path else None
+            if not path or not path.exists():
                 default_path = self.base_dir / "data" / "settings.json"
-                if default_path.exists():
-                    import json
-                    settings = json.loads(default_path.read_text(encoding="utf-8"))
-                    vendor = settings.get("VENDOR_TRYON", "Gemini")
-                    return vendor
+                path = default_path if default_path.exists() else None
+            if path is None:
+                return "Gemini"
+
+            mtime_ns = path.stat().st_mtime_ns
+            cached = self._vendor_cache
+            if cached and cached[0] == path and cached[1] == mtime_ns:
+                return cached[2]
+
+            # read_bytes 省掉文字解碼；json.loads 可直接吃 UTF-8 bytes
+            settings = json.loads(path.read_bytes())
+            vendor = settings.get("VENDOR_TRYON", "Gemini")
+            self._vendor_cache = (path, mtime_ns, vendor)
+            return vendor
         except Exception as e:
-            print(f"[TryOn] Error loading vendor setting: {e}")
+            log.warning("Error loading vendor setting: %s", e)
         return "Gemini"  # Default to Gemini
 
     def _to_web_url(self, abs_path: Union[str, Path, None]) -> Optional[str]:
@@ -188,22 +254,34 @@ class TryOnService:
             return None
         
         abs_path_str = str(abs_path)
-        
+
+        # 快路徑：輸出 static 目錄底下的檔案一次 removeprefix 就得到相對段，
+        # POSIX 上連分隔符轉換都省掉
+        prefix = self._static_prefix
+        if abs_path_str.startswith(prefix):
+            rel = abs_path_str[len(prefix):]
+            if rel.startswith(os.path.sep):
+                if not _SEP_IS_SLASH:
+                    rel = rel.replace(os.path.sep, "/")
+                return "/static" + rel
+
         # Find the 'static' directory component in the path
         try:
             # This finds the last occurrence of 'static' and splits the string there
             # e.g., /path/to/project/apps/web/static/outputs/img.jpg
             # -> ('/path/to/project/apps/web/', 'static/outputs/img.jpg')
-            _head, _sep, tail = abs_path_str.rpartition(os.path.sep + 'static' + os.path.sep)
+            _head, _sep, tail = abs_path_str.rpartition(_STATIC_SEP)
             if tail:
                 # We want '/static/outputs/img.jpg'
-                return f"/static/{tail.replace(os.path.sep, '/')}"
+                if not _SEP_IS_SLASH:
+                    tail = tail.replace(os.path.sep, "/")
+                return f"/static/{tail}"
         except Exception:
             pass
 
         # Fallback for unexpected path formats, just return the filename
         # This is not ideal but prevents catastrophic failure.
-        print(f"[TryOn] Warning: could not convert path to web URL: {abs_path_str}")
+        log.warning("could not convert path to web URL: %s", abs_path_str)
         return Path(abs_path_str).name
 
     def _public_to_abs(self, public_path: Optional[str]) -> Optional[str]:
@@ -229,13 +307,13 @@ class TryOnService:
         """Start try-on and return session info.
         For now, we decode data URL or, if already data URL, just store it as-is.
         """
-        session_id = f"tryon_{int(time.time()*1000)}"
+        session_id = f"tryon_{secrets.token_urlsafe(9)}"
         out_path = self._outputs_dir / f"{session_id}.jpg"
 
         # Reload vendor setting (hot-reload support)
         self._vendor = self._load_vendor_setting()
         
-        print(f"[TryOn] start session={session_id} garment_url={garment_image_url} vendor={self._vendor}")
+        log.info("start session=%s garment_url=%s vendor=%s", session_id, garment_image_url, self._vendor)
 
         # Route to appropriate vendor
         if self._vendor == "KlingAI":
@@ -264,116 +342,78 @@ class TryOnService:
     ) -> Dict:
         """Start try-on using KlingAI service"""
         if not self.klingai:
-            print(f"[TryOn] KlingAI service not available")
+            log.error("KlingAI service not available")
             return {"status": "error", "message": "KlingAI service not initialized"}
         
         # 熱重載 KlingAI 設定（確保取得最新的 API 金鑰）
         try:
             self.klingai._reload_settings_if_changed()
         except Exception as e:
-            print(f"[TryOn] KlingAI reload settings failed: {e}")
+            log.warning("KlingAI reload settings failed: %s", e)
         
         klingai_access_set = bool(getattr(self.klingai, "access_key", None))
         klingai_secret_set = bool(getattr(self.klingai, "secret_key", None))
         
-        print(f"[TryOn] KlingAI keys check: access={klingai_access_set}, secret={klingai_secret_set}")
+        log.debug("KlingAI keys check: access=%s, secret=%s", klingai_access_set, klingai_secret_set)
         
         if not (klingai_access_set and klingai_secret_set):
-            print(f"[TryOn] KlingAI API keys not configured")
+            log.error("KlingAI API keys not configured")
             return {"status": "error", "message": "KlingAI API 金鑰未設定，請至管理控制台→系統設定中填入 KLINGAI_ACCESS_KEY 和 KLINGAI_SECRET_KEY"}
         
         try:
-            # 1) 將使用者 data-url 轉為檔案
-            user_path = self._write_data_url_to_file(
-                user_image_data_url, self.legacy_inputs_dir / f"user_{session_id}.jpg"
-            )
-        except ValueError as exc:
-            print(f"[TryOn] invalid user image: {exc}")
-            return {"status": "error", "message": str(exc)}
-        
-        try:
-            # 記錄試衣開始
-            self._save_tryon_record(session_id, user_path=str(user_path), status="processing")
-
-            # 2) 解析 garment 路徑
-            garment_for_klingai = None
-            garment_abs_path = None
-            norm_url = garment_image_url
-            try:
-                if garment_image_url and not garment_image_url.startswith("data:image") and not garment_image_url.startswith("/static/"):
-                    p = urlparse(garment_image_url)
-                    if p.path and p.path.startswith("/static/"):
-                        norm_url = p.path
-            except Exception:
-                pass
-
-            if norm_url and isinstance(norm_url, str) and norm_url.startswith("/static/"):
-                rel = garment_image_url[len("/static/"):]
-                src = self.base_dir / "apps" / "web" / "static" / rel
-                dst = self.base_dir / "app" / "static" / rel
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                if src.exists():
-                    try:
-                        shutil.copyfile(src, dst)
-                        garment_for_klingai = {"image_path": rel}
-                        garment_abs_path = str(dst)
-                        print(f"[TryOn] garment copied src={src} -> dst={dst}")
-                    except Exception as ce:
-                        print(f"[TryOn] garment copy failed: {ce}")
-            elif norm_url and isinstance(norm_url, str) and norm_url.startswith("data:image"):
-                g_path = self._write_data_url_to_file(norm_url, self.legacy_inputs_dir / f"garment_{session_id}.jpg")
-                rel = f"static/inputs/{g_path.name}"
-                garment_for_klingai = {"image_path": rel}
-                garment_abs_path = str(g_path)
-                print(f"[TryOn] garment data-url saved {g_path}")
-            
-            if garment_abs_path:
-                self._save_tryon_record(session_id, garment_path=garment_abs_path, status="processing")
-            
-            # 3) 背景執行 KlingAI
+            # 1) 解析並 staging garment
+            garment_for_klingai, garment_abs_path = self._resolve_garment(garment_image_url, session_id)
+            # 2) 背景執行 KlingAI
+            fut = self._bind_session(session_id)
             def _bg_job_klingai() -> None:
                 result_abs_path = None
                 try:
-                    print(f"[TryOn] bg_job KlingAI start for session={session_id}")
+                    log.debug("bg_job KlingAI start for session=%s", session_id)
+                    # 使用者照片的 base64 解碼與寫檔移到背景，請求執行緒立即返回
+                    user_path = self._write_data_url_to_file(
+                        user_image_data_url, self.legacy_inputs_dir / f"user_{session_id}.jpg"
+                    )
+                    self._save_tryon_record(
+                        session_id, user_path=str(user_path), garment_path=garment_abs_path, status="processing"
+                    )
                     res = self.klingai.generate_virtual_tryon(
                         user_image_path=str(user_path),
                         garment=garment_for_klingai,
                         session_id=session_id,
                         user_note=user_note,
                     )
-                    print(f"[TryOn] KlingAI result status={res.get('status')} mode={res.get('mode')} out={res.get('output_path')}")
+                    log.debug("KlingAI result status=%s mode=%s out=%s", res.get("status"), res.get("mode"), res.get("output_path"))
                     out_public = res.get("output_path")
                     if res.get("status") == "ok" and out_public:
                         if out_public.startswith("/static/outputs/"):
                             fname = out_public.split("/")[-1]
                             result_abs_path = str(self.base_dir / "apps" / "web" / "static" / "outputs" / fname)
-                        with self._lock:
-                            self._session_outputs[session_id] = out_public
+                        fut.set_result(out_public)
                         self._save_tryon_record(session_id, result_path=result_abs_path, status="ok")
-                        print(f"[TryOn] bg_job KlingAI SUCCESS for session={session_id} output={out_public}")
+                        log.info("bg_job KlingAI SUCCESS for session=%s output=%s", session_id, out_public)
                     else:
                         msg = res.get("message") if isinstance(res, dict) else "try-on failed"
-                        with self._lock:
-                            self._session_errors[session_id] = msg or "try-on failed"
+                        fut.set_exception(RuntimeError(msg or "try-on failed"))
                         self._save_tryon_record(session_id, status="error", error_msg=msg)
-                        print(f"[TryOn] bg_job KlingAI FAILED for session={session_id} msg={msg}")
+                        log.warning("bg_job KlingAI FAILED for session=%s msg=%s", session_id, msg)
+                except ValueError as exc:
+                    log.warning("invalid user image: %s", exc)
+                    fut.set_exception(RuntimeError(str(exc)))
+                    self._save_tryon_record(session_id, status="error", error_msg=str(exc))
                 except Exception as e:
-                    print(f"[TryOn] background KlingAI generation error: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    log.exception("background KlingAI generation error: %s", e)
                     err_msg = f"error: {type(e).__name__}"
-                    with self._lock:
-                        self._session_errors[session_id] = err_msg
+                    fut.set_exception(RuntimeError(err_msg))
                     self._save_tryon_record(session_id, status="error", error_msg=err_msg)
 
-            threading.Thread(target=_bg_job_klingai, daemon=True).start()
-            print(f"[TryOn] bg_job KlingAI thread started for session={session_id}")
+            self._bg_pool.submit(_bg_job_klingai)
+            log.debug("bg_job KlingAI thread started for session=%s", session_id)
             return {"session_id": session_id, "status": "processing", "preview": user_image_data_url}
         except ValueError as exc:
-            print(f"[TryOn] garment image invalid: {exc}")
+            log.warning("garment image invalid: %s", exc)
             return {"status": "error", "message": str(exc)}
         except Exception as ge:
-            print(f"[TryOn] KlingAI pipeline error: {ge}")
+            log.error("KlingAI pipeline error: %s", ge)
             return {"status": "error", "message": str(ge)}
 
     def _start_tryon_gemini(
@@ -386,71 +426,33 @@ class TryOnService:
     ) -> Dict:
         """Start try-on using Gemini service"""
         client_on = bool(getattr(self.gemini, "client", None)) if self.gemini else False
-        print(f"[TryOn] start Gemini session={session_id} garment_url={garment_image_url} gemini={'on' if client_on else 'off'}")
+        log.info("start Gemini session=%s garment_url=%s gemini=%s", session_id, garment_image_url, "on" if client_on else "off")
 
         # 若可用，走 Gemini 真實流程（改為背景執行，避免請求阻塞/超時）
         if self.gemini and user_image_data_url and user_image_data_url.startswith("data:image"):
             try:
-                # 1) 將使用者 data-url 轉為檔案供 Gemini 使用
-                user_path = self._write_data_url_to_file(
-                    user_image_data_url, self.legacy_inputs_dir / f"user_{session_id}.jpg"
-                )
-            except ValueError as exc:
-                print(f"[TryOn] invalid user image: {exc}")
-                return {"status": "error", "message": str(exc)}
-            try:
-                # 記錄試衣開始
-                self._save_tryon_record(session_id, user_path=str(user_path), status="processing")
-
-                # 2) 解析 garment：若為 /static/ 開頭，複製到 app/static 對應位置並傳入相對路徑
-                garment_for_gemini = None
-                garment_abs_path = None
-                # 正規化 garment 路徑（支援完整 URL）：抽出 /static/ 相對路徑
-                norm_url = garment_image_url
-                try:
-                    if garment_image_url and not garment_image_url.startswith("data:image") and not garment_image_url.startswith("/static/"):
-                        p = urlparse(garment_image_url)
-                        if p.path and p.path.startswith("/static/"):
-                            norm_url = p.path
-                except Exception:
-                    pass
-
-                if norm_url and isinstance(norm_url, str) and norm_url.startswith("/static/"):
-                    rel = garment_image_url[len("/static/"):]
-                    src = self.base_dir / "apps" / "web" / "static" / rel
-                    dst = self.base_dir / "app" / "static" / rel
-                    dst.parent.mkdir(parents=True, exist_ok=True)
-                    if src.exists():
-                        try:
-                            shutil.copyfile(src, dst)
-                            garment_for_gemini = {"image_path": rel}
-                            garment_abs_path = str(dst)
-                            print(f"[TryOn] garment copied src={src} -> dst={dst}")
-                        except Exception as ce:
-                            print(f"[TryOn] garment copy failed: {ce}")
-                elif norm_url and isinstance(norm_url, str) and norm_url.startswith("data:image"):
-                    # 將 data-url 服飾圖寫入 app/static/inputs 並傳相對路徑
-                    g_path = self._write_data_url_to_file(norm_url, self.legacy_inputs_dir / f"garment_{session_id}.jpg")
-                    rel = f"static/inputs/{g_path.name}"
-                    garment_for_gemini = {"image_path": rel}
-                    garment_abs_path = str(g_path)
-                    print(f"[TryOn] garment data-url saved {g_path}")
-                
-                # 更新記錄：添加服飾圖片路徑
-                if garment_abs_path:
-                    self._save_tryon_record(session_id, garment_path=garment_abs_path, status="processing")
-                # 3) 背景執行，完成後寫入輸出供輪詢取得
+                # 1) 解析並 staging garment
+                garment_for_gemini, garment_abs_path = self._resolve_garment(garment_image_url, session_id)
+                # 2) 背景執行，完成後寫入輸出供輪詢取得
+                fut = self._bind_session(session_id)
                 def _bg_job() -> None:
                     result_abs_path = None
                     try:
-                        print(f"[TryOn] bg_job start for session={session_id}")
+                        log.debug("bg_job start for session=%s", session_id)
+                        # 使用者照片的 base64 解碼與寫檔移到背景，請求執行緒立即返回
+                        user_path = self._write_data_url_to_file(
+                            user_image_data_url, self.legacy_inputs_dir / f"user_{session_id}.jpg"
+                        )
+                        self._save_tryon_record(
+                            session_id, user_path=str(user_path), garment_path=garment_abs_path, status="processing"
+                        )
                         res = self.gemini.generate_virtual_tryon(
                             user_image_path=str(user_path),
                             garment=garment_for_gemini,
                             session_id=session_id,
                             user_note=user_note,
                         )
-                        print(f"[TryOn] gemini result status={res.get('status')} mode={res.get('mode')} out={res.get('output_path')}")
+                        log.debug("gemini result status=%s mode=%s out=%s", res.get("status"), res.get("mode"), res.get("output_path"))
                         out_public = res.get("output_path")
                         if res.get("status") == "ok" and out_public:
                             # 將 public URL (/static/outputs/xxx.jpg) 轉為絕對路徑
@@ -458,38 +460,37 @@ class TryOnService:
                             if out_public.startswith("/static/outputs/"):
                                 fname = out_public.split("/")[-1]
                                 result_abs_path = str(self.base_dir / "apps" / "web" / "static" / "outputs" / fname)
-                            with self._lock:
-                                self._session_outputs[session_id] = out_public
+                            fut.set_result(out_public)
                             # 更新記錄：成功
                             self._save_tryon_record(session_id, result_path=result_abs_path, status="ok")
-                            print(f"[TryOn] bg_job SUCCESS for session={session_id} output={out_public}")
+                            log.info("bg_job SUCCESS for session=%s output=%s", session_id, out_public)
                         else:
                             # 標記錯誤，讓輪詢可結束
                             msg = res.get("message") if isinstance(res, dict) else "try-on failed"
-                            with self._lock:
-                                self._session_errors[session_id] = msg or "try-on failed"
+                            fut.set_exception(RuntimeError(msg or "try-on failed"))
                             # 更新記錄：失敗
                             self._save_tryon_record(session_id, status="error", error_msg=msg)
-                            print(f"[TryOn] bg_job FAILED for session={session_id} msg={msg}")
+                            log.warning("bg_job FAILED for session=%s msg=%s", session_id, msg)
+                    except ValueError as exc:
+                        log.warning("invalid user image: %s", exc)
+                        fut.set_exception(RuntimeError(str(exc)))
+                        self._save_tryon_record(session_id, status="error", error_msg=str(exc))
                     except Exception as e:
-                        print(f"[TryOn] background generation error: {e}")
-                        import traceback
-                        traceback.print_exc()
+                        log.exception("background generation error: %s", e)
                         err_msg = f"error: {type(e).__name__}"
-                        with self._lock:
-                            self._session_errors[session_id] = err_msg
+                        fut.set_exception(RuntimeError(err_msg))
                         # 更新記錄：異常
                         self._save_tryon_record(session_id, status="error", error_msg=err_msg)
 
-                threading.Thread(target=_bg_job, daemon=True).start()
-                print(f"[TryOn] bg_job thread started for session={session_id}")
+                self._bg_pool.submit(_bg_job)
+                log.debug("bg_job thread started for session=%s", session_id)
                 # 立即回覆：提供上傳預覽但不標記為最終輸出，前端改以輪詢確認最終合成
                 return {"session_id": session_id, "status": "processing", "preview": user_image_data_url}
             except ValueError as exc:
-                print(f"[TryOn] garment image invalid: {exc}")
+                log.warning("garment image invalid: %s", exc)
                 return {"status": "error", "message": str(exc)}
             except Exception as ge:
-                print(f"[TryOn] gemini pipeline error: {ge}")
+                log.error("gemini pipeline error: %s", ge)
 
         # Fallback：只回傳預覽（不標記為最終輸出，避免誤判完成）
         try:
@@ -502,37 +503,62 @@ class TryOnService:
     def get_result(self, session_id: str) -> Dict:
         # mock: immediately done, return preview url
         if not session_id:
-            print("[TryOn] get_result missing session_id")
+            log.warning("get_result missing session_id")
             return {"status": "error", "message": "session_id missing"}
         
-        # 使用鎖保護字典讀取，避免競爭條件
-        with self._lock:
-            # 優先檢查錯誤（確保錯誤不被覆蓋）
-            err_msg = self._session_errors.get(session_id)
-            if err_msg:
-                print(f"[TryOn] result ERROR session={session_id} msg={err_msg}")
+        # Future 的 done()/exception()/result() 皆 thread-safe，輪詢不需要鎖
+        fut = self._sessions.get(session_id)
+        if fut is not None and fut.done():
+            exc = fut.exception()
+            if exc is not None:
+                err_msg = str(exc) or "try-on failed"
+                log.warning("result ERROR session=%s msg=%s", session_id, err_msg)
                 return {"status": "error", "message": err_msg, "output": None}
-            
-            # 檢查成功輸出
-            if session_id in self._session_outputs:
-                out = self._session_outputs.get(session_id)
-                print(f"[TryOn] result OK (memo) session={session_id} out={out}")
-                return {"status": "ok", "output": out}
-        
+            out = fut.result()
+            log.debug("result OK (memo) session=%s out=%s", session_id, out)
+            return {"status": "ok", "output": out}
+
         # 檢查檔案系統（不需要鎖）
         fname = f"{session_id}.jpg"
         candidate = self._outputs_dir / fname
         if candidate.exists():
             pub = f"/static/outputs/{fname}"
-            with self._lock:
-                self._session_outputs[session_id] = pub
-            print(f"[TryOn] result OK (file) session={session_id} path={pub}")
+            if fut is None:
+                # 重啟後的舊 session：補一個已完成的 Future 讓後續輪詢走記憶路徑
+                memo: Future = Future()
+                memo.set_result(pub)
+                with self._sessions_lock:
+                    self._sessions.setdefault(session_id, memo)
+            log.debug("result OK (file) session=%s path=%s", session_id, pub)
             return {"status": "ok", "output": pub}
-        
+
         # 仍在處理中
-        print(f"[TryOn] result PENDING session={session_id}")
+        log.debug("result PENDING session=%s", session_id)
         return {"status": "pending"}
 
+    def _bind_session(self, session_id: str) -> Future:
+        """為 session 建立結果 Future；鎖只涵蓋 dict 插入本身。"""
+        fut: Future = Future()
+        with self._sessions_lock:
+            self._sessions[session_id] = fut
+        return fut
+
+    def _fail_session(self, session_id: str, message: str) -> None:
+        self._bind_session(session_id).set_exception(RuntimeError(message))
+
+    def _ensure_dir(self, p: Path) -> None:
+        """建立目錄並記住已存在者，熱路徑不再重複 stat/mkdir。"""
+        s = str(p)
+        if s in self._known_dirs:
+            return
+        p.mkdir(parents=True, exist_ok=True)
+        self._known_dirs.add(s)
+
+    def close(self) -> None:
+        """關閉背景工作池；不等待進行中的工作完成。"""
+        self._bg_pool.shutdown(wait=False)
+        self._io_pool.shutdown(wait=False)
+
     def start_tryon_advanced(
         self,
         *,
@@ -541,14 +567,14 @@ class TryOnService:
         user_note: Optional[str] = None,
     ) -> Dict:
         """進階試衣：根據服飾類型自動選擇適合的 prompt 與流程。"""
-        session_id = f"tryon_{int(time.time()*1000)}"
+        session_id = f"tryon_{secrets.token_urlsafe(9)}"
 
         # Reload vendor setting (hot-reload support)
         self._vendor = self._load_vendor_setting()
         
         # KlingAI doesn't have advanced mode, use standard mode
         if self._vendor == "KlingAI":
-            print(f"[TryOn] KlingAI doesn't support advanced mode, using standard try-on")
+            log.info("KlingAI doesn't support advanced mode, using standard try-on")
             return self._start_tryon_klingai(
                 session_id=session_id,
                 user_image_data_url=user_image_data_url,
@@ -557,97 +583,43 @@ class TryOnService:
             )
 
         client_on = bool(getattr(self.gemini, "client", None)) if self.gemini else False
-        print(f"[TryOn] start ADVANCED session={session_id} garment_url={garment_image_url} gemini={'on' if client_on else 'off'}")
+        log.info("start ADVANCED session=%s garment_url=%s gemini=%s", session_id, garment_image_url, "on" if client_on else "off")
 
         if not self.gemini or not getattr(self.gemini, "client", None):
-            print(f"[TryOn] ADVANCED FAILED session={session_id} reason=gemini_unavailable gemini={bool(self.gemini)} client={getattr(self.gemini, 'client', None) if self.gemini else None}")
-            with self._lock:
-                self._session_errors[session_id] = "Gemini client unavailable"
+            log.error("ADVANCED FAILED session=%s reason=gemini_unavailable gemini=%s client=%s", session_id, bool(self.gemini), getattr(self.gemini, "client", None) if self.gemini else None)
+            self._fail_session(session_id, "Gemini client unavailable")
             return {"session_id": session_id, "status": "error", "message": "Gemini client unavailable"}
 
         if not (user_image_data_url and user_image_data_url.startswith("data:image")):
             return {"session_id": session_id, "status": "processing", "preview": None}
 
         try:
-            user_path = self._write_data_url_to_file(
-                user_image_data_url, self.legacy_inputs_dir / f"user_{session_id}.jpg"
-            )
-        except ValueError as exc:
-            print(f"[TryOn] invalid user image (advanced): {exc}")
-            return {"status": "error", "message": str(exc)}
-
-        try:
-            self._save_tryon_record(session_id, user_path=str(user_path), status="processing")
-
-            garment_for_gemini = None
-            garment_abs_path = None
-            norm_url = garment_image_url
-            print(f"[TryOn] DEBUG: garment_image_url={garment_image_url}")
-            try:
-                if garment_image_url and not garment_image_url.startswith("data:image") and not garment_image_url.startswith("/static/"):
-                    parsed = urlparse(garment_image_url)
-                    if parsed.path and parsed.path.startswith("/static/"):
-                        norm_url = parsed.path
-            except Exception:
-                pass
-
-            print(f"[TryOn] DEBUG: norm_url={norm_url}")
-            
-            if norm_url and isinstance(norm_url, str) and norm_url.startswith("/static/"):
-                rel = norm_url[len("/static/"):]
-                print(f"[TryOn] DEBUG: rel={rel}")
-                
-                # 尝试多个可能的源路径
-                possible_sources = [
-                    self.base_dir / "apps" / "web" / "static" / rel,  # 原路径
-                    Path.cwd() / "static" / rel,  # live-demo 路径
-                    self.base_dir / "static" / rel,  # base_dir 下的 static
-                ]
-                
-                src = None
-                for candidate in possible_sources:
-                    print(f"[TryOn] DEBUG: Trying source path: {candidate}, exists={candidate.exists()}")
-                    if candidate.exists():
-                        src = candidate
-                        break
-                
-                if src:
-                    dst = self.base_dir / "app" / "static" / rel
-                    dst.parent.mkdir(parents=True, exist_ok=True)
-                    try:
-                        shutil.copyfile(src, dst)
-                        garment_for_gemini = {"image_path": rel}
-                        garment_abs_path = str(dst)
-                        print(f"[TryOn] garment copied src={src} -> dst={dst}")
-                    except Exception as ce:
-                        print(f"[TryOn] garment copy failed: {ce}")
-                        import traceback
-                        traceback.print_exc()
-                else:
-                    print(f"[TryOn] ERROR: garment image not found in any source path! rel={rel}")
-            elif norm_url and isinstance(norm_url, str) and norm_url.startswith("data:image"):
-                try:
-                    g_path = self._write_data_url_to_file(norm_url, self.legacy_inputs_dir / f"garment_{session_id}.jpg")
-                    rel = f"static/inputs/{g_path.name}"
-                    garment_for_gemini = {"image_path": rel}
-                    garment_abs_path = str(g_path)
-                    print(f"[TryOn] garment data-url saved {g_path}")
-                except Exception as ce:
-                    print(f"[TryOn] garment data-url save failed: {ce}")
-
-            if garment_abs_path:
-                self._save_tryon_record(session_id, garment_path=garment_abs_path, status="processing")
+            # garment 解析/staging 丟進 I/O 池，與背景工作裡的使用者圖解碼並行
+            garment_fut = self._io_pool.submit(self._resolve_garment, garment_image_url, session_id)
 
             # ⚡ OPTIMIZATION: Skip TryOnAnalysis for SIMPLE mode
             # SIMPLE mode uses pure visual extraction, no text descriptions needed
             # This saves 1-2 seconds and one Gemini API call per try-on
             garment_info: Dict[str, Any] = {}
-            print(f"[TryOn] SIMPLE mode: Skipping text analysis (pure visual extraction)")
+            log.debug("SIMPLE mode: Skipping text analysis (pure visual extraction)")
 
+            fut = self._bind_session(session_id)
             def _bg_job_advanced() -> None:
                 result_abs_path = None
                 try:
-                    print(f"[TryOn] bg_job ADVANCED start for session={session_id}")
+                    log.debug("bg_job ADVANCED start for session=%s", session_id)
+                    # 使用者照片的 base64 解碼與寫檔移到背景，請求執行緒立即返回
+                    user_path = self._write_data_url_to_file(
+                        user_image_data_url, self.legacy_inputs_dir / f"user_{session_id}.jpg"
+                    )
+                    try:
+                        garment_for_gemini, garment_abs_path = garment_fut.result()
+                    except ValueError as ce:
+                        log.warning("garment data-url save failed: %s", ce)
+                        garment_for_gemini, garment_abs_path = None, None
+                    self._save_tryon_record(
+                        session_id, user_path=str(user_path), garment_path=garment_abs_path, status="processing"
+                    )
 
                     # 對於換髮型系統，使用 SIMPLE 模式讓 AI 直接看圖片來提取髮型
                     # 視覺提取比文字描述更精確
@@ -659,39 +631,38 @@ class TryOnService:
                         user_note=user_note,
                     )
 
-                    print(f"[TryOn] gemini ADVANCED result status={res.get('status')} mode={res.get('mode')} out={res.get('output_path')}")
+                    log.debug("gemini ADVANCED result status=%s mode=%s out=%s", res.get("status"), res.get("mode"), res.get("output_path"))
                     out_public = res.get("output_path")
                     if res.get("status") == "ok" and out_public:
                         if out_public.startswith("/static/outputs/"):
                             fname = out_public.split("/")[-1]
                             result_abs_path = str(self.base_dir / "apps" / "web" / "static" / "outputs" / fname)
-                        with self._lock:
-                            self._session_outputs[session_id] = out_public
+                        fut.set_result(out_public)
                         self._save_tryon_record(session_id, result_path=result_abs_path, status="ok")
-                        print(f"[TryOn] bg_job ADVANCED SUCCESS session={session_id} output={out_public}")
+                        log.info("bg_job ADVANCED SUCCESS session=%s output=%s", session_id, out_public)
                     else:
                         msg = res.get("message") if isinstance(res, dict) else "try-on failed"
-                        with self._lock:
-                            self._session_errors[session_id] = msg or "try-on failed"
+                        fut.set_exception(RuntimeError(msg or "try-on failed"))
                         self._save_tryon_record(session_id, status="error", error_msg=msg)
-                        print(f"[TryOn] bg_job ADVANCED FAILED session={session_id} msg={msg}")
+                        log.warning("bg_job ADVANCED FAILED session=%s msg=%s", session_id, msg)
+                except ValueError as exc:
+                    log.warning("invalid user image (advanced): %s", exc)
+                    fut.set_exception(RuntimeError(str(exc)))
+                    self._save_tryon_record(session_id, status="error", error_msg=str(exc))
                 except Exception as e:
-                    print(f"[TryOn] background ADVANCED generation error: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    log.exception("background ADVANCED generation error: %s", e)
                     err_msg = f"error: {type(e).__name__}"
-                    with self._lock:
-                        self._session_errors[session_id] = err_msg
+                    fut.set_exception(RuntimeError(err_msg))
                     self._save_tryon_record(session_id, status="error", error_msg=err_msg)
 
-            threading.Thread(target=_bg_job_advanced, daemon=True).start()
-            print(f"[TryOn] bg_job ADVANCED thread started for session={session_id}")
+            self._bg_pool.submit(_bg_job_advanced)
+            log.debug("bg_job ADVANCED thread started for session=%s", session_id)
             return {"session_id": session_id, "status": "processing", "preview": user_image_data_url}
         except ValueError as exc:
-            print(f"[TryOn] garment image invalid (advanced): {exc}")
+            log.warning("garment image invalid (advanced): %s", exc)
             return {"status": "error", "message": str(exc)}
         except Exception as ge:
-            print(f"[TryOn] gemini ADVANCED pipeline error: {ge}")
+            log.error("gemini ADVANCED pipeline error: %s", ge)
 
         return {"session_id": session_id, "status": "processing", "preview": None}
 
@@ -702,14 +673,14 @@ class TryOnService:
         garment_image_url: Optional[str] = None,
         user_note: Optional[str] = None,
     ) -> Dict:
-        session_id = f"tryon_{int(time.time()*1000)}"
+        session_id = f"tryon_{secrets.token_urlsafe(9)}"
         
         # Reload vendor setting (hot-reload support)
         self._vendor = self._load_vendor_setting()
         
         # KlingAI doesn't have two-phase mode, use standard mode
         if self._vendor == "KlingAI":
-            print(f"[TryOn] KlingAI doesn't support two-phase mode, using standard try-on")
+            log.info("KlingAI doesn't support two-phase mode, using standard try-on")
             return self._start_tryon_klingai(
                 session_id=session_id,
                 user_image_data_url=user_image_data_url,
@@ -718,64 +689,24 @@ class TryOnService:
             )
         
         client_on = bool(getattr(self.gemini, "client", None)) if self.gemini else False
-        print(f"[TryOn] start INTIMATE 2-PHASE session={session_id} garment_url={garment_image_url} gemini={'on' if client_on else 'off'}")
+        log.info("start INTIMATE 2-PHASE session=%s garment_url=%s gemini=%s", session_id, garment_image_url, "on" if client_on else "off")
 
         if not self.gemini or not getattr(self.gemini, "client", None):
-            with self._lock:
-                self._session_errors[session_id] = "Gemini API 未配置或不可用，請檢查 API 金鑰設定"
+            self._fail_session(session_id, "Gemini API 未配置或不可用，請檢查 API 金鑰設定")
             return {"session_id": session_id, "status": "error", "message": "Gemini API 未配置或不可用"}
 
         if not user_image_data_url or not user_image_data_url.startswith("data:image"):
             return {"status": "error", "message": "請提供 data-url 圖片"}
 
         try:
-            user_path = self._write_data_url_to_file(
-                user_image_data_url, self.legacy_inputs_dir / f"user_{session_id}.jpg"
-            )
-        except ValueError as exc:
-            return {"status": "error", "message": str(exc)}
-
-        garment_for_gemini = None
-        garment_abs_path = None
-        norm_url = garment_image_url
-        try:
-            if garment_image_url and not garment_image_url.startswith("data:image") and not garment_image_url.startswith("/static/"):
-                p = urlparse(garment_image_url)
-                if p.path and p.path.startswith("/static/"):
-                    norm_url = p.path
-        except Exception:
-            pass
-
-        if norm_url and isinstance(norm_url, str) and norm_url.startswith("/static/"):
-            rel = norm_url[len("/static/"):]
-            src = self.base_dir / "apps" / "web" / "static" / rel
-            dst = self.base_dir / "app" / "static" / rel
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            if src.exists():
-                try:
-                    shutil.copyfile(src, dst)
-                    garment_for_gemini = {"image_path": rel}
-                    garment_abs_path = str(dst)
-                    print(f"[TryOn] garment copied src={src} -> dst={dst}")
-                except Exception as ce:
-                    print(f"[TryOn] garment copy failed: {ce}")
-        elif norm_url and isinstance(norm_url, str) and norm_url.startswith("data:image"):
-            try:
-                g_path = self._write_data_url_to_file(norm_url, self.legacy_inputs_dir / f"garment_{session_id}.jpg")
-                rel = f"static/inputs/{g_path.name}"
-                garment_for_gemini = {"image_path": rel}
-                garment_abs_path = str(g_path)
-                print(f"[TryOn] garment data-url saved {g_path}")
-            except Exception as ce:
-                print(f"[TryOn] garment data-url save failed: {ce}")
+            garment_for_gemini, garment_abs_path = self._resolve_garment(garment_image_url, session_id)
+        except ValueError as ce:
+            log.warning("garment data-url save failed: %s", ce)
+            garment_for_gemini, garment_abs_path = None, None
 
-        self._save_tryon_record(session_id, user_path=str(user_path), status="processing")
-        if garment_abs_path:
-            self._save_tryon_record(session_id, garment_path=garment_abs_path, status="processing")
-        else:
+        if not garment_abs_path:
             msg = "無法取得服飾參考圖，請確認商品圖片"
-            with self._lock:
-                self._session_errors[session_id] = msg
+            self._fail_session(session_id, msg)
             return {"status": "error", "message": msg}
 
         upper_note = "Ensure upper-body clothing matches the reference garment exactly; if the reference torso is bare, keep the torso bare (within SFW rules)."
@@ -784,10 +715,18 @@ class TryOnService:
             upper_note = upper_note + " " + user_note
             lower_note = lower_note + " " + user_note
 
+        fut = self._bind_session(session_id)
         def _bg_job_two_phase() -> None:
             result_abs_path = None
             try:
-                print(f"[TryOn] two-phase TOP start session={session_id}")
+                # 使用者照片的 base64 解碼與寫檔移到背景，請求執行緒立即返回
+                user_path = self._write_data_url_to_file(
+                    user_image_data_url, self.legacy_inputs_dir / f"user_{session_id}.jpg"
+                )
+                self._save_tryon_record(
+                    session_id, user_path=str(user_path), garment_path=garment_abs_path, status="processing"
+                )
+                log.debug("two-phase TOP start session=%s", session_id)
                 res_upper = self.gemini.generate_virtual_tryon_simple(
                     user_image_path=str(user_path),
                     garment=garment_for_gemini,
@@ -797,20 +736,16 @@ class TryOnService:
                 )
                 if res_upper.get("status") != "ok" or not res_upper.get("output_path"):
                     msg = res_upper.get("message") or "upper stage failed"
-                    with self._lock:
-                        self._session_errors[session_id] = msg
+                    fut.set_exception(RuntimeError(msg))
                     self._save_tryon_record(session_id, status="error", error_msg=msg)
-                    print(f"[TryOn] two-phase TOP failed session={session_id} msg={msg}")
+                    log.warning("two-phase TOP failed session=%s msg=%s", session_id, msg)
                     return
 
                 upper_public = res_upper.get("output_path")
-                upper_abs = self._public_to_abs(upper_public)
-                if upper_abs:
-                    self._save_tryon_record(session_id, result_path=upper_abs, status="processing")
-                else:
-                    upper_abs = str(user_path)
+                # 中繼結果不落 DB：最終 save 會寫入 lower 階段的 result_path
+                upper_abs = self._public_to_abs(upper_public) or str(user_path)
 
-                print(f"[TryOn] two-phase BOTTOM start session={session_id}")
+                log.debug("two-phase BOTTOM start session=%s", session_id)
                 res_lower = self.gemini.generate_virtual_tryon_simple(
                     user_image_path=upper_abs,
                     garment=garment_for_gemini,
@@ -823,70 +758,196 @@ class TryOnService:
                     if out_public and out_public.startswith("/static/outputs/"):
                         fname = out_public.split("/")[-1]
                         result_abs_path = str(self.base_dir / "apps" / "web" / "static" / "outputs" / fname)
-                    with self._lock:
-                        self._session_outputs[session_id] = out_public
+                    fut.set_result(out_public)
                     self._save_tryon_record(session_id, result_path=result_abs_path, status="ok")
-                    print(f"[TryOn] two-phase SUCCESS session={session_id} output={out_public}")
+                    log.info("two-phase SUCCESS session=%s output=%s", session_id, out_public)
                 else:
                     msg = res_lower.get("message") or "lower stage failed"
-                    with self._lock:
-                        self._session_errors[session_id] = msg
+                    fut.set_exception(RuntimeError(msg))
                     self._save_tryon_record(session_id, status="error", error_msg=msg)
-                    print(f"[TryOn] two-phase BOTTOM failed session={session_id} msg={msg}")
+                    log.warning("two-phase BOTTOM failed session=%s msg=%s", session_id, msg)
+            except ValueError as exc:
+                log.warning("invalid user image (two-phase): %s", exc)
+                fut.set_exception(RuntimeError(str(exc)))
+                self._save_tryon_record(session_id, status="error", error_msg=str(exc))
             except Exception as e:
-                print(f"[TryOn] two-phase pipeline error: {e}")
-                import traceback
-                traceback.print_exc()
+                log.exception("two-phase pipeline error: %s", e)
                 err_msg = f"two_phase error: {type(e).__name__}"
-                with self._lock:
-                    self._session_errors[session_id] = err_msg
+                fut.set_exception(RuntimeError(err_msg))
                 self._save_tryon_record(session_id, status="error", error_msg=err_msg)
 
-        threading.Thread(target=_bg_job_two_phase, daemon=True).start()
+        self._bg_pool.submit(_bg_job_two_phase)
         return {"session_id": session_id, "status": "processing", "preview": user_image_data_url}
 
     # Helpers -----------------------------------------------------------------
+    def _resolve_garment(self, garment_image_url: Optional[str], session_id: str) -> tuple:
+        """正規化服飾來源並 staging 到 app/static。
+
+        統一四條 start 路徑原本重複的解析/複製邏輯。
+        回傳 (garment_dict, garment_abs_path)；無法解析時皆為 None。
+        data-url 解碼失敗會拋出 ValueError，由呼叫端決定如何回報。
+        """
+        if not garment_image_url or not isinstance(garment_image_url, str):
+            return None, None
+
+        # 常見情況 URL 已是 /static/... 或 data:image，不需付 urlparse 的成本；
+        # 只有完整 http(s)://... 形式才解析取 path
+        norm_url = garment_image_url
+        if not norm_url.startswith(("data:image", "/static/")) and "://" in norm_url:
+            try:
+                p = urlparse(norm_url)
+                if p.path and p.path.startswith("/static/"):
+                    norm_url = p.path
+            except Exception:
+                pass
+
+        if norm_url.startswith("/static/"):
+            rel = norm_url[len("/static/"):]
+            # 依序嘗試 web、live-demo 與 base_dir 的 static 來源
+            possible_sources = (
+                self.base_dir / "apps" / "web" / "static" / rel,
+                Path.cwd() / "static" / rel,
+                self.base_dir / "static" / rel,
+            )
+            src = next((c for c in possible_sources if c.exists()), None)
+            if src is None:
+                log.warning("garment image not found in any source path: rel=%s", rel)
+                return None, None
+            dst = self.base_dir / "app" / "static" / rel
+            self._ensure_dir(dst.parent)
+            try:
+                self._stage_garment(src, dst)
+            except Exception as ce:
+                log.warning("garment copy failed: %s", ce)
+                return None, None
+            garment = {"image_path": rel}
+            mm = self._open_garment_mmap(dst)
+            if mm is not None:
+                garment["image_bytes"] = mm
+            log.debug("garment staged src=%s -> dst=%s", src, dst)
+            return garment, str(dst)
+
+        if norm_url.startswith("data:image"):
+            g_path = self._write_data_url_to_file(norm_url, self.legacy_inputs_dir / f"garment_{session_id}.jpg")
+            log.debug("garment data-url saved %s", g_path)
+            return {"image_path": f"static/inputs/{g_path.name}"}, str(g_path)
+
+        return None, None
+
+    _GARMENT_MMAP_MAX = 16
+
+    def _open_garment_mmap(self, path: Path) -> Optional[mmap.mmap]:
+        """取得已 staging 服飾圖的唯讀 mmap（LRU 上限 16 張）。
+
+        只用於不可變的商品圖；data-url 上傳的一次性服飾圖不經過這裡。
+        """
+        key = str(path)
+        with self._garment_mmap_lock:
+            mm = self._garment_mmap_cache.get(key)
+            if mm is not None and not mm.closed:
+                self._garment_mmap_cache.move_to_end(key)
+                return mm
+        try:
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        with self._garment_mmap_lock:
+            self._garment_mmap_cache[key] = mm
+            while len(self._garment_mmap_cache) > self._GARMENT_MMAP_MAX:
+                _, evicted = self._garment_mmap_cache.popitem(last=False)
+                try:
+                    evicted.close()
+                except Exception:
+                    pass
+        return mm
+
     @staticmethod
-    def _write_data_url_to_file(data_url: str, dst_path: Path) -> Path:
-        """將 data:image/...;base64,xxxxx 轉為實體檔案。"""
-        if not data_url or "," not in data_url:
+    def _stage_garment(src: Path, dst: Path) -> None:
+        """將服飾圖 staging 到 app/static。
+
+        同一檔案系統優先 hardlink（O(1) metadata 操作，不佔頁快取）；
+        跨裝置退回 copy_file_range（btrfs/xfs 可走 CoW reflink，
+        其餘檔案系統也在核心內零拷貝）；兩者都不行才整檔複製。
+        """
+        try:
+            dst.unlink(missing_ok=True)
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+        try:
+            size = os.stat(src).st_size
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                copied = 0
+                while copied < size:
+                    n = os.copy_file_range(s.fileno(), d.fileno(), size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+            if copied >= size:
+                return
+        except (AttributeError, OSError):
+            pass
+        shutil.copyfile(src, dst)
+
+    def _write_data_url_to_file(self, data_url: Union[str, bytes], dst_path: Path) -> Path:
+        """將 data:image/...;base64,xxxxx 轉為實體檔案。
+
+        以 bytes + memoryview 切出 base64 payload 直接解碼：
+        不為多 MB 的 payload 另外配置一份 str 子字串，
+        也跳過 UTF-8 驗證（payload 依定義是 ASCII）。
+        """
+        if not data_url:
             raise ValueError("無法解析上傳的圖片資料，請重新選擇。")
+        if isinstance(data_url, bytes):
+            s = data_url
+        else:
+            try:
+                s = data_url.encode("ascii")
+            except UnicodeEncodeError as exc:
+                raise ValueError("圖片資料解碼失敗，請改用 JPG 或 PNG 檔案。") from exc
 
-        header, b64 = data_url.split(",", 1)
+        comma = s.find(b",")
+        if comma < 0:
+            raise ValueError("無法解析上傳的圖片資料，請重新選擇。")
+
+        header = s[:comma]
         try:
-            raw = base64.b64decode(b64)
+            raw = base64.b64decode(memoryview(s)[comma + 1:], validate=False)
         except Exception as exc:
             raise ValueError("圖片資料解碼失敗，請改用 JPG 或 PNG 檔案。") from exc
 
         mime = "image/jpeg"
-        if ";" in header and ":" in header:
+        if b";" in header and b":" in header:
             try:
-                mime = header.split(":", 1)[1].split(";", 1)[0].strip().lower()
+                mime = header.split(b":", 1)[1].split(b";", 1)[0].strip().lower().decode("ascii")
             except Exception:
                 mime = "image/jpeg"
 
-        dst_path.parent.mkdir(parents=True, exist_ok=True)
+        self._ensure_dir(dst_path.parent)
 
         if Image is None:
             if mime in ("image/jpeg", "image/jpg"):
-                with open(dst_path, "wb") as f:
-                    f.write(raw)
+                dst_path.write_bytes(raw)
                 return dst_path
             raise ValueError("伺服器暫時無法處理此圖片格式，請改用 JPG 或 PNG。")
 
+        if mime in HEIF_MIME_TYPES:
+            _ensure_heif()
+
         try:
             with Image.open(BytesIO(raw)) as im:
                 im = im.convert("RGB")
                 im.save(dst_path, format="JPEG", quality=90)
             return dst_path
         except Exception as exc:
-            mime_lower = mime.lower()
-            if mime_lower in ("image/jpeg", "image/jpg"):
-                with open(dst_path, "wb") as f:
-                    f.write(raw)
+            # mime 已在解析時轉為小寫
+            if mime in ("image/jpeg", "image/jpg"):
+                dst_path.write_bytes(raw)
                 return dst_path
-            if mime_lower in HEIF_MIME_TYPES:
-                if not HEIF_SUPPORTED:
+            if mime in HEIF_MIME_TYPES:
+                if not _ensure_heif():
                     raise ValueError(
                         "偵測到 iPhone HEIC/HEIF 照片，目前伺服器尚未啟用 HEIC 轉換，請改用 JPG/PNG，或在 iPhone 的「設定→相機→格式」中選擇「最相容」。"
                     ) from exc
@@ -963,6 +1024,6 @@ class TryOnService:
                     db.add(record)
                 db.commit()
         except Exception as e:
-            print(f"[TryOn] failed to save record: {e}")
+            log.warning("failed to save record: %s", e)
 
 